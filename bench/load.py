@@ -0,0 +1,422 @@
+# بنشمارك/لود تست يشتغل بدون نت: VoiceClient وهمي، yt-dlp وهمي بتأخير قابل للضبط،
+# وسيرفر HTTP محلي يقدم ملف أوبوس بدل يوتيوب. يحتاج ffmpeg فقط.
+#
+#   python bench/load.py --guilds 20 --ytdl-latency 1.5 --out bench_output.json
+#
+# المخرجات JSON: زمن أول صوت من رسالة شغل (p50/p99)، فجوات الانتقال بين الأغاني،
+# عدد عمليات ffmpeg لكل نوع أكشن، CPU و RSS لكل سيرفر.
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+import discord.player  # noqa: E402
+
+import main  # noqa: E402
+
+
+def pct(values, p):
+    return main._percentile(values, p)
+
+
+# --------------------------- عدّاد ffmpeg ---------------------------
+class SpawnCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._popen = subprocess.Popen
+
+    def install(self):
+        counter = self
+
+        class CountingPopen(self._popen):
+            def __init__(self, args, *a, **kw):
+                if args and "ffmpeg" in os.path.basename(str(args[0])):
+                    with counter._lock:
+                        counter.count += 1
+                super().__init__(args, *a, **kw)
+
+        discord.player.subprocess.Popen = CountingPopen
+
+
+spawns = SpawnCounter()
+
+
+# --------------------------- سيرفر الصوت ---------------------------
+def make_audio(path: str, seconds: float):
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", "96k", path],
+        check=True,
+    )
+
+
+def start_audio_server(path: str) -> ThreadingHTTPServer:
+    with open(path, "rb") as f:
+        payload = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        # كل المسارات ترجع نفس الملف، مع دعم Range عشان الـ seek
+        def do_GET(self):
+            start, end = 0, len(payload) - 1
+            rng = self.headers.get("Range")
+            if rng and rng.startswith("bytes="):
+                a, _, b = rng[6:].partition("-")
+                start = int(a or 0)
+                end = min(int(b), end) if b else end
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "audio/webm")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            try:
+                self.wfile.write(payload[start:end + 1])
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --------------------------- yt-dlp وهمي ---------------------------
+def make_stub_ydl(base_url: str, latency: float, duration: int):
+    class StubYoutubeDL:
+        calls = 0
+
+        def __init__(self, opts=None):
+            self.opts = opts or {}
+
+        def extract_info(self, target, download=False, process=True, ie_key=None):
+            StubYoutubeDL.calls += 1
+            time.sleep(latency * random.uniform(0.8, 1.2))
+            vid = str(abs(hash(target)) % 10 ** 11).rjust(11, "0")
+            info = {
+                "id": vid,
+                "title": f"stub {target[-40:]}",
+                "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+                "url": f"{base_url}/{vid}.webm?expire={int(time.time()) + 6 * 3600}",
+                "acodec": "opus",
+                "ext": "webm",
+                "duration": duration,
+            }
+            if target.startswith("ytsearch"):
+                return {"_type": "playlist", "entries": [info]}
+            return info
+
+    return StubYoutubeDL
+
+
+# --------------------------- ديسكورد وهمي ---------------------------
+class Recorder:
+    def __init__(self):
+        self.first_audio = []  # ثواني من رسالة شغل لأول فريم
+        self.gaps = []  # ثواني بين آخر فريم وأول فريم اللي بعده (نهاية طبيعية فقط)
+        self.pending_first: dict = {}  # guild id -> وقت الرسالة
+        self.edits = 0
+        self.sends = 0
+
+
+rec = Recorder()
+
+
+class FakeMessage:
+    def __init__(self, channel, content="", author=None, guild=None):
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.id = random.getrandbits(48)
+
+    async def edit(self, **kwargs):
+        rec.edits += 1
+
+    async def delete(self, **kwargs):
+        pass
+
+
+class FakeTextChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.id = random.getrandbits(48)
+
+    async def send(self, content=None, **kwargs):
+        rec.sends += 1
+        return FakeMessage(self, content or "")
+
+
+class FakeAudioPlayer(threading.Thread):
+    # نفس إيقاع AudioPlayer حق المكتبة: فريم كل 20ms
+    def __init__(self, vc, source, after):
+        super().__init__(daemon=True)
+        self.vc = vc
+        self.source = source
+        self.after = after
+        self.end = threading.Event()
+        self.resumed = threading.Event()
+        self.resumed.set()
+
+    def run(self):
+        error = None
+        first = True
+        last_frame = None
+        try:
+            next_at = time.perf_counter()
+            while not self.end.is_set():
+                if not self.resumed.is_set():
+                    self.resumed.wait()
+                    next_at = time.perf_counter()
+                    continue
+                data = self.source.read()
+                if not data:
+                    break
+                last_frame = time.perf_counter()
+                if first:
+                    self.vc.first_frame(last_frame)
+                    first = False
+                next_at += 0.02
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            self.vc.source_ended(last_frame, natural=not self.end.is_set())
+            if self.after:
+                self.after(error)
+            self.source.cleanup()
+
+
+class FakeVoiceClient:
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = channel.guild
+        self._player = None
+        self._connected = True
+        self._last_natural_end = None
+
+    @property
+    def source(self):
+        return self._player.source if self._player else None
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._player is not None and self._player.resumed.is_set()
+
+    def is_paused(self):
+        return self._player is not None and not self._player.resumed.is_set()
+
+    def play(self, source, *, after=None):
+        if self.is_playing():
+            raise discord.ClientException("Already playing audio.")
+        self._player = FakeAudioPlayer(self, source, after)
+        self._player.start()
+
+    def stop(self):
+        if self._player:
+            self._player.end.set()
+            self._player.resumed.set()
+        self._player = None
+
+    def pause(self):
+        if self._player:
+            self._player.resumed.clear()
+
+    def resume(self):
+        if self._player:
+            self._player.resumed.set()
+
+    async def disconnect(self, force=False):
+        self.stop()
+        self._connected = False
+
+    def first_frame(self, at):
+        sent = rec.pending_first.pop(self.guild.id, None)
+        if sent is not None:
+            rec.first_audio.append(at - sent)
+        if self._last_natural_end is not None:
+            rec.gaps.append(at - self._last_natural_end)
+        self._last_natural_end = None
+
+    def source_ended(self, last_frame, natural):
+        self._last_natural_end = last_frame if natural else None
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild):
+        self.guild = guild
+        self.members = []
+
+    async def connect(self, **kwargs):
+        return FakeVoiceClient(self)
+
+
+class FakeMember:
+    def __init__(self, guild, voice_channel):
+        self.id = random.getrandbits(48)
+        self.bot = False
+        self.guild = guild
+        self.display_name = f"user-{self.id % 1000}"
+        self.voice = type("VoiceState", (), {"channel": voice_channel})()
+
+
+class FakeGuild:
+    def __init__(self, gid):
+        self.id = gid
+        self.voice_channel = FakeVoiceChannel(self)
+        self.text_channel = FakeTextChannel(self)
+        self.member = FakeMember(self, self.voice_channel)
+        self.voice_channel.members.append(self.member)
+
+
+# --------------------------- السيناريو ---------------------------
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def phase(name, guilds, action, settle, results):
+    before = spawns.count
+    await asyncio.gather(*(action(g) for g in guilds))
+    await asyncio.sleep(settle)
+    results[name] = {"actions": len(guilds), "ffmpeg_spawns": spawns.count - before,
+                      "spawns_per_action": round((spawns.count - before) / max(1, len(guilds)), 3)}
+
+
+async def run(args) -> dict:
+    guilds = [FakeGuild(1000 + i) for i in range(args.guilds)]
+    actions = {}
+    rss0 = rss_bytes()
+    cpu0 = time.process_time()
+    child0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+
+    async def play(g, n):
+        for k in range(n):
+            msg = FakeMessage(g.text_channel, f"شغل song {g.id}-{k}", author=g.member, guild=g)
+            if k == 0:
+                rec.pending_first[g.id] = time.perf_counter()
+            await main.on_message(msg)
+
+    await phase("play", guilds, lambda g: play(g, args.tracks), args.settle, actions)
+    players = [main.players[g.id] for g in guilds if g.id in main.players]
+
+    async def volume(g):
+        p = main.players.get(g.id)
+        if p:
+            for _ in range(args.clicks):
+                await p.set_volume(-0.1, g.text_channel)
+
+    async def seek(g):
+        p = main.players.get(g.id)
+        if p:
+            await p.seek(10, g.text_channel)
+
+    async def skip(g):
+        p = main.players.get(g.id)
+        if p:
+            await p.skip()
+
+    await phase("volume", guilds, volume, args.settle, actions)
+    actions["volume"]["actions"] *= args.clicks
+    actions["volume"]["spawns_per_action"] = round(actions["volume"]["ffmpeg_spawns"] / max(1, actions["volume"]["actions"]), 3)
+    await phase("seek", guilds, seek, args.settle, actions)
+    await phase("skip", guilds, skip, args.settle, actions)
+
+    # خلي الباقي يخلص طبيعيًا عشان نقيس فجوات الانتقال
+    await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - started
+    child1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    transitions = [t for p in players for t in p.transition_times]
+    for p in list(main.players.values()):
+        await p.close()
+
+    n = max(1, args.guilds)
+    return {
+        "config": vars(args),
+        "wall_seconds": round(elapsed, 3),
+        "enqueue_to_first_audio": {"count": len(rec.first_audio), "p50": pct(rec.first_audio, 50),
+                                   "p99": pct(rec.first_audio, 99)},
+        "transition_gap": {"count": len(rec.gaps), "p50": pct(rec.gaps, 50), "p99": pct(rec.gaps, 99)},
+        "player_transition": {"count": len(transitions), "p50": pct(transitions, 50), "p99": pct(transitions, 99)},
+        "actions": actions,
+        "ffmpeg_spawns_total": spawns.count,
+        "panel": {"sends": rec.sends, "edits": rec.edits},
+        "cpu_seconds_per_guild": round((time.process_time() - cpu0) / n, 4),
+        "ffmpeg_cpu_seconds_per_guild": round(
+            ((child1.ru_utime + child1.ru_stime) - (child0.ru_utime + child0.ru_stime)) / n, 4),
+        "rss_bytes_per_guild": (rss_bytes() - rss0) // n,
+        "extraction": main.extraction_pool.stats(),
+        "resolve_cache": {"hits": main.resolve_cache.hits, "misses": main.resolve_cache.misses,
+                          "shared": main.resolve_cache.shared},
+    }
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="offline load test for the music bot")
+    ap.add_argument("--guilds", type=int, default=10)
+    ap.add_argument("--tracks", type=int, default=3, help="شغل لكل سيرفر")
+    ap.add_argument("--clicks", type=int, default=3, help="ضغطات صوت لكل سيرفر")
+    ap.add_argument("--ytdl-latency", type=float, default=1.0, help="ثواني لكل استخراج وهمي")
+    ap.add_argument("--track-seconds", type=int, default=8, help="طول الملف الصوتي")
+    ap.add_argument("--settle", type=float, default=2.0, help="انتظار بعد كل مرحلة")
+    ap.add_argument("--drain", type=float, default=20.0, help="انتظار بالنهاية لانتقالات طبيعية")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--throttle", action="store_true", help="خل حدود الطلبات (RATE_*) شغالة")
+    ap.add_argument("--out", help="ملف JSON للنتائج (الافتراضي stdout)")
+    return ap.parse_args()
+
+
+def cli():
+    args = parse_args()
+    random.seed(args.seed)
+    tmp = tempfile.mkdtemp(prefix="bench-audio-")
+    audio = os.path.join(tmp, "tone.webm")
+    make_audio(audio, args.track_seconds)
+    server = start_audio_server(audio)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    main.yt_dlp.YoutubeDL = make_stub_ydl(base_url, args.ytdl_latency, args.track_seconds)
+    if not args.throttle:
+        # كل السيرفرات الوهمية يطلب فيها عضو واحد بسرعة، فالحدود تخرب القياس
+        main.user_limiter.capacity = main.guild_limiter.capacity = float("inf")
+    spawns.install()
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        server.shutdown()
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    cli()
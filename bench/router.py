@@ -0,0 +1,64 @@
+# كم رسالة بالثانية يقدر on_message يرفض (ترافيك سوالف، مو أوامر):
+# قبل = strip + re.match لكل نمط نصي، بعد = CommandRouter
+#
+#   python bench/router.py [عدد_الرسايل]
+import os
+import re
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+LEGACY_PATTERNS = [
+    r"^\s*بروفايل(?:\s+(\d+))?\s*$",
+    r"^\s*شغل\s+(.+)$",
+    r"^\s*تشغيل\s+(.+)$",
+]
+
+CHAT = [
+    "السلام عليكم", "هلا والله", "وش صار على الموضوع؟", "ههههههه", "lol", "gg",
+    "https://tenor.com/view/funny-cat-gif-123456", "<:pepe:1234567890>", "تمام", "شغلني معكم",
+    "   مساء الخير", "وقف هنا يا شباب", "who's up for a game tonight?", "😂😂😂", "!rank",
+    "شكلها الأغنية حلوة", "تخطيت المرحلة أخيرًا", "ok", "الطابور طويل اليوم بالمطعم", "",
+]
+
+
+def legacy(content: str):
+    content = content.strip()
+    for pat in LEGACY_PATTERNS:
+        m = re.match(pat, content, flags=re.IGNORECASE)
+        if m:
+            return m
+    return None
+
+
+def run(fn, messages) -> float:
+    started = time.perf_counter()
+    for content in messages:
+        fn(content)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main_bench(n: int):
+    random.seed(0)
+    messages = [random.choice(CHAT) + (" " + str(i) if i % 3 else "") for i in range(n)]
+    # تأكد إن ولا وحدة منها تنحسب أمر عند الطريقتين
+    assert not any(main.router.match(m) for m in messages)
+    assert not any(legacy(m) for m in messages)
+    run(legacy, messages[:1000])  # تسخين
+    before = run(legacy, messages)
+    after = run(main.router.match, messages)
+    print(json.dumps({
+        "messages": n,
+        "msgs_per_sec_before": round(before),
+        "msgs_per_sec_after": round(after),
+        "speedup": round(after / before, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,107 @@
+# قياس الذاكرة لكل أغنية في الطابور (tracemalloc):
+# قبل = Track يحتفظ بنتيجة yt-dlp كاملة، بعد = Track المختصر الحالي
+#
+#   python bench/track_memory.py [عدد_الأغاني]
+import os
+import sys
+import json
+import random
+import string
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def _rand(n: int) -> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=n))
+
+
+def fake_full_info(i: int) -> dict:
+    # شكل قريب من نتيجة extract_info لفيديو يوتيوب عادي
+    vid = _rand(11)
+    expire = 1_900_000_000
+    headers = {
+        "User-Agent": "Mozilla/5.0 " + _rand(80),
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-us,en;q=0.5",
+        "Sec-Fetch-Mode": "navigate",
+    }
+    formats = [
+        {
+            "format_id": str(100 + f),
+            "url": f"https://rr1---sn-{_rand(8)}.googlevideo.com/videoplayback?expire={expire}&id={vid}&{_rand(900)}",
+            "ext": random.choice(["webm", "m4a", "mp4"]),
+            "acodec": random.choice(["opus", "mp4a.40.2", "none"]),
+            "vcodec": random.choice(["vp9", "avc1.4d401f", "none"]),
+            "abr": random.random() * 160,
+            "filesize": random.randint(1_000_000, 90_000_000),
+            "http_headers": dict(headers),
+            "downloader_options": {"http_chunk_size": 10485760},
+            "protocol": "https",
+        }
+        for f in range(25)
+    ]
+    return {
+        "id": vid,
+        "title": f"Track {i} " + _rand(40),
+        "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+        "url": formats[0]["url"],
+        "acodec": "opus",
+        "ext": "webm",
+        "duration": random.randint(120, 600),
+        "thumbnail": f"https://i.ytimg.com/vi/{vid}/maxresdefault.jpg",
+        "uploader": "Channel " + _rand(12),
+        "view_count": random.randint(0, 10**9),
+        "description": _rand(2000),
+        "tags": [_rand(10) for _ in range(30)],
+        "formats": formats,
+        "thumbnails": [{"url": f"https://i.ytimg.com/vi/{vid}/{t}.jpg", "id": str(t)} for t in range(40)],
+        "automatic_captions": {
+            _rand(2): [{"ext": ext, "url": f"https://www.youtube.com/api/timedtext?v={vid}&{_rand(300)}"}
+                       for ext in ("json3", "srv1", "srv2", "srv3", "vtt")]
+            for _ in range(100)
+        },
+        "http_headers": dict(headers),
+    }
+
+
+class LegacyTrack:
+    # نسخة Track القديمة: تحتفظ بالـ info كامل
+    def __init__(self, info, requested_by):
+        self.info = info
+        self.title = info.get("title", "بدون عنوان")
+        self.webpage_url = info.get("webpage_url") or info.get("url")
+        self.stream_url = info.get("url")
+        self.duration = info.get("duration")
+        self.requested_by = requested_by
+
+
+def measure(make, infos) -> int:
+    # نحسب فقط اللي يبقى حي بعد بناء الطابور
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queue = main.TrackQueue(make(info) for info in infos)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del queue
+    return total
+
+
+def main_bench(n: int):
+    random.seed(0)
+    # كل مرة نولد infos جديدة عشان القياس الأول ما يشارك نصوص مع الثاني
+    legacy = measure(lambda info: LegacyTrack(info, None), (fake_full_info(i) for i in range(n)))
+    slim = measure(lambda info: main.Track(main.slim_info(info), None), (fake_full_info(i) for i in range(n)))
+    print(json.dumps({
+        "tracks": n,
+        "bytes_per_track_before": legacy // n,
+        "bytes_per_track_after": slim // n,
+        "reduction": round(1 - slim / legacy, 4) if legacy else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -1,9 +1,28 @@
 import os
 import re
+import sys
+import json
+import math
+import time
 import random
+import signal
 import asyncio
+import pstats
+import cProfile
+import tracemalloc
+import bisect
+import functools
+import warnings
+import threading
+import sqlite3
+import subprocess
+import urllib.request
+from array import array
+from collections import OrderedDict, deque
+from itertools import islice
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from enum import Enum
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Awaitable, Deque, Iterable, Iterator
 
 import discord
 from discord.ext import commands
@@ -17,8 +36,23 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
+# الشاردات: BOT_PROCESSES > 1 يشغل لانشر يوزع الشاردات على عمليات، كل عملية لها مشغلاتها
+# SHARD_IDS/SHARD_COUNT يحطها اللانشر للعمليات الفرعية (أو يدويًا لو التوزيع من برا)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0 = من /gateway/bot
+SHARD_IDS = [int(s) for s in os.getenv("SHARD_IDS", "").split(",") if s.strip()]
+BOT_PROCESSES = int(os.getenv("BOT_PROCESSES", "1"))
+SHARDED = os.getenv("SHARDED", "0") == "1" or SHARD_COUNT > 0 or bool(SHARD_IDS) or BOT_PROCESSES > 1
+
 # ما نستخدم بريفكس، بنعتمد على on_message
-bot = commands.Bot(command_prefix=commands.when_mentioned_or(""), intents=intents)
+if SHARDED:
+    bot = commands.AutoShardedBot(
+        command_prefix=commands.when_mentioned_or(""),
+        intents=intents,
+        shard_count=SHARD_COUNT or None,
+        shard_ids=SHARD_IDS or None,
+    )
+else:
+    bot = commands.Bot(command_prefix=commands.when_mentioned_or(""), intents=intents)
 bot.remove_command("help")
 
 
@@ -29,9 +63,267 @@ YTDL_OPTS = {
     "noplaylist": True,
     "default_search": "ytsearch",
 }
+# قوائم التشغيل: استخراج سطحي (بدون فورمات) والأغاني تنحل وحدة وحدة قبل تشغيلها
+YTDL_FLAT_OPTS = {
+    "quiet": True,
+    "extract_flat": "in_playlist",
+    "lazy_playlist": True,
+    "noplaylist": False,
+}
+PLAYLIST_MAX_ENTRIES = int(os.getenv("PLAYLIST_MAX_ENTRIES", "500"))
 FFMPEG_BEFORE = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
 # سنحقن الفوليوم والـ seek في options كل مرة ننشئ السورس
 
+# opus: نمرر الأوبوس من يوتيوب كما هو (بدون فك/ترميز) لما يكون الصوت 100%
+# pcm: الطريقة القديمة، ffmpeg يفك لـ PCM والمكتبة ترمّز أوبوس بالبايثون
+AUDIO_MODE = os.getenv("AUDIO_MODE", "opus")
+# الـ passthrough ما يقبل فوليوم، فأول تغيير من 100% يبدل السورس لـ PCM مرة وحدة (ffmpeg + اتصال جديد).
+# VOLUME_INSTANT=1 يبدأ كل الأغاني PCM عشان حتى أول ضغطة تكون بدون أي عملية جديدة، على حساب CPU أكثر
+VOLUME_INSTANT = os.getenv("VOLUME_INSTANT", "0") == "1"
+
+# تشغيل بدون فواصل: الأغنية الجاية تبدأ تتفك قبل نهاية الحالية وتدخل مباشرة (أو بـ crossfade).
+# يحتاج PCM، فيلغي مسار الـ passthrough
+GAPLESS = os.getenv("GAPLESS", "0") == "1"
+CROSSFADE_SECONDS = float(os.getenv("CROSSFADE_SECONDS", "0"))
+PREBUFFER_SECONDS = float(os.getenv("PREBUFFER_SECONDS", "3"))  # حد البفر للأغنية الجاية
+
+PRELOAD_LEAD = 20  # ثواني قبل نهاية الأغنية نجدد روابط اللي بعدها
+PRELOAD_COUNT = 2  # كم أغنية جاية نجهزها
+# روابط الستريم الموقعة تنتهي: نتأكد قبل كل سورس، ونرجع لنفس المكان لو الستريم انقطع بالنص
+STREAM_FRESH_MAX = 3600.0  # أقصى مدة نطلب الرابط يبقى صالح لها (الروابط تعيش ~6 ساعات)
+STREAM_EARLY_END = 5.0  # السورس خلص قبل المدة بأكثر من كذا = انقطاع مو نهاية
+STREAM_RECOVER_MAX = 3  # محاولات الرجوع لكل أغنية
+HISTORY_MAX = int(os.getenv("HISTORY_MAX", "100"))  # الهستوري حلقة بحجم ثابت
+PANEL_MIN_INTERVAL = float(os.getenv("PANEL_MIN_INTERVAL", "1.5"))  # أقل وقت بين تعديلين للبانل
+TRANSITION_BUDGET = float(os.getenv("TRANSITION_BUDGET_MS", "250")) / 1000  # أقصى زمن مقبول بين أغنيتين
+
+# تنظيف المشغلات الخاملة (بالثواني)
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "300"))  # ما فيه تشغيل
+EMPTY_TIMEOUT = float(os.getenv("EMPTY_TIMEOUT", "60"))  # الروم ما فيه غير بوتات
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "30"))
+
+
+# --------------------------- المقاييس (Prometheus) ---------------------------
+# عدادات بسيطة بالذاكرة؛ الرندر والحسابات الثقيلة تصير بس وقت السحب
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 = الإندبوينت معطل
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_GUILD_BUCKETS = int(os.getenv("METRICS_GUILD_BUCKETS", "16"))  # السيرفرات تتجمع بدل label لكل سيرفر
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List["_Metric"] = []
+
+
+def guild_bucket(guild_id: int) -> str:
+    return str(guild_id % METRICS_GUILD_BUCKETS)
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        _metrics.append(self)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_label_str(self.labels, key)} {value}"
+
+
+_INF_LABEL = 'le="+Inf"'
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = buckets
+        self._values: Dict[tuple, list] = {}  # labels -> [عدادات البكتات..., المجموع, العدد]
+
+    def observe(self, value: float, *labels):
+        row = self._values.get(labels)
+        if row is None:
+            row = self._values[labels] = [0] * (len(self.buckets) + 2)
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def samples(self):
+        for key, row in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_bucket{_label_str(self.labels, key, _INF_LABEL)} {row[-1]}"
+            yield f"{self.name}_sum{_label_str(self.labels, key)} {row[-2]}"
+            yield f"{self.name}_count{_label_str(self.labels, key)} {row[-1]}"
+
+
+class CallbackGauge(_Metric):
+    # القيمة تنحسب وقت السحب فقط، فما لها أي كلفة بين السحبات
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: tuple, fn: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, doc, labels)
+        self.fn = fn
+
+    def samples(self):
+        for key, value in self.fn().items():
+            yield f"{self.name}{_label_str(self.labels, key)} {value}"
+
+
+def _count_ffmpeg_children() -> Dict[tuple, float]:
+    # عمليات ffmpeg الحية اللي أبوها هذا البروسس (لينكس فقط)
+    me = os.getpid()
+    alive = 0
+    try:
+        pids = [d for d in os.listdir("/proc") if d.isdigit()]
+    except OSError:
+        return {}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # الصيغة: pid (comm) state ppid ...
+        comm = stat[stat.find("(") + 1:stat.rfind(")")]
+        ppid = int(stat[stat.rfind(")") + 2:].split()[1])
+        if ppid == me and comm == "ffmpeg":
+            alive += 1
+    return {(): alive}
+
+
+def _queue_lengths() -> Dict[tuple, float]:
+    out: Dict[tuple, float] = {}
+    for guild_id, player in players.items():
+        key = (guild_bucket(guild_id),)
+        out[key] = out.get(key, 0) + len(player.queue)
+    return out
+
+
+def transition_stats() -> Dict[str, Any]:
+    # آخر الانتقالات من كل المشغلات الحية مع بعض
+    times = [t for player in players.values() for t in player.transition_times]
+    return {
+        "count": len(times),
+        "p50": _percentile(times, 50),
+        "p99": _percentile(times, 99),
+        "over_budget": sum(player.transitions_over_budget for player in players.values()),
+    }
+
+
+def panel_stats() -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for player in players.values():
+        for key, value in player.panel.stats().items():
+            out[key] = out.get(key, 0) + value
+    return out
+
+
+def _transition_gauges() -> Dict[tuple, float]:
+    stats = transition_stats()
+    return {(q,): stats[q] for q in ("p50", "p99") if stats[q] is not None}
+
+
+def _pool_gauges() -> Dict[tuple, float]:
+    stats = extraction_pool.stats()
+    return {("running",): stats["running"], ("pending",): stats["pending"]}
+
+
+FETCH_SECONDS = Histogram("bot_fetch_yt_info_seconds", "fetch_yt_info latency incl. cache/single-flight", ("guild_bucket",))
+EXTRACT_WAIT_SECONDS = Histogram("bot_extract_queue_wait_seconds", "time an extraction waited for a worker")
+EXTRACT_RUN_SECONDS = Histogram("bot_extract_run_seconds", "yt-dlp extraction time on a worker")
+EXTRACT_RESULTS = Counter("bot_extract_total", "extraction pool outcomes", ("result",))
+RESOLVE_CACHE_LOOKUPS = Counter("bot_resolve_cache_total", "resolution cache lookups", ("result",))
+PLAYER_EVENT_SECONDS = Histogram(
+    "bot_player_event_seconds", "time the player task spent handling one event (serialized section)",
+    ("guild_bucket", "event"),
+)
+TRANSITION_SECONDS = Histogram("bot_track_transition_seconds", "source end to next vc.play", ("guild_bucket",))
+TRANSITIONS_OVER_BUDGET = Counter("bot_track_transitions_over_budget_total", "transitions slower than TRANSITION_BUDGET_MS",
+                                  ("guild_bucket",))
+FFMPEG_SPAWNS = Counter("bot_ffmpeg_spawns_total", "ffmpeg sources created", ("kind",))
+PANEL_EDITS = Counter("bot_panel_edits_total", "panel edits sent to discord", ("guild_bucket",))
+PANEL_SKIPPED = Counter("bot_panel_edits_skipped_total", "panel edits avoided", ("guild_bucket", "reason"))
+STREAM_REFRESHES = Counter("bot_stream_refreshes_total", "stream URL re-resolutions before playback", ("reason",))
+STREAM_RECOVERIES = Counter("bot_stream_recoveries_total", "mid-track stream failures", ("result",))
+CallbackGauge("bot_ffmpeg_processes", "live ffmpeg child processes", (), _count_ffmpeg_children)
+CallbackGauge("bot_queue_length", "queued tracks", ("guild_bucket",), _queue_lengths)
+CallbackGauge("bot_players", "guild players", ("state",),
+              lambda: {(state,): count for state, count in player_counts().items()})
+CallbackGauge("bot_extract_pool", "extraction pool jobs", ("state",), _pool_gauges)
+CallbackGauge("bot_panel_updates", "panel update requests vs edits sent, live players", ("result",),
+              lambda: {(result,): count for result, count in panel_stats().items()})
+CallbackGauge("bot_track_transition_gap_seconds", "recent track transition gap across live players", ("quantile",),
+              _transition_gauges)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=5)
+        # نقرأ الهيدرز ونتجاهلها
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            body = render_metrics().encode()
+            head = "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+        else:
+            body = b"not found\n"
+            head = "HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n"
+        writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server() -> Optional[asyncio.AbstractServer]:
+    if not METRICS_PORT:
+        return None
+    server = await asyncio.start_server(_serve_metrics, METRICS_HOST, METRICS_PORT)
+    print(f"📈 metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return server
+
 
 # --------------------------- كائنات المساعدة ---------------------------
 class LoopMode(Enum):
@@ -40,15 +332,52 @@ class LoopMode(Enum):
     ALL = 2
 
 
+class PlayerEvent(Enum):
+    PLAY = 0  # ابدأ لو ما فيه شي شغال
+    TRACK_END = 1  # السورس خلص (يوصل من ثريد الصوت)
+    SKIP = 2
+    PREVIOUS = 3
+    SEEK = 4
+    VOLUME = 5
+    STOP = 6
+    ADVANCED = 7  # الميكسر انتقل للأغنية الجاية بنفسه (وضع gapless)
+    RESTORE = 8  # رجوع جلسة محفوظة بعد ريستارت
+
+
 class Track:
+    # ما نحتفظ بنتيجة yt-dlp كاملة، بس الحقول اللي نعرضها/نشغلها
+    __slots__ = (
+        "video_id", "title", "webpage_url", "stream_url", "expires_at", "acodec",
+        "duration", "thumbnail", "uploader", "view_count", "requested_by",
+    )
+
     def __init__(self, info: Dict[str, Any], requested_by: discord.Member):
-        self.info = info  # معلومات yt-dlp
+        self.video_id = info.get("id")
         self.title = info.get("title", "بدون عنوان")
         self.webpage_url = info.get("webpage_url") or info.get("url")
         self.stream_url = info.get("url")
+        self.expires_at = stream_expiry(self.stream_url)  # وقت يونكس
+        self.acodec = info.get("acodec")
         self.duration = info.get("duration")  # بالثواني أو None
+        self.thumbnail = info.get("thumbnail")
+        self.uploader = info.get("uploader")
+        self.view_count = info.get("view_count")
         self.requested_by = requested_by
 
+    def is_fresh(self, within: float = 0.0) -> bool:
+        # هل رابط الستريم يبقى صالح لين بعد within ثانية؟
+        return bool(self.stream_url) and self.expires_at > time.time() + within
+
+    def refresh(self, info: Dict[str, Any]):
+        self.stream_url = info.get("url")
+        self.expires_at = stream_expiry(self.stream_url)
+        self.acodec = info.get("acodec")
+        # أغاني القوائم تنضاف بمعلومات ناقصة، نكملها أول ما تنحل
+        self.duration = self.duration or info.get("duration")
+        self.thumbnail = self.thumbnail or info.get("thumbnail")
+        self.uploader = self.uploader or info.get("uploader")
+        self.view_count = self.view_count or info.get("view_count")
+
     def __str__(self):
         return self.title
 
@@ -57,14 +386,454 @@ def is_url(q: str) -> bool:
     return q.startswith("http://") or q.startswith("https://")
 
 
+def is_playlist_url(q: str) -> bool:
+    # قوائم يوتيوب والميكسات (list=RD...)
+    return is_url(q) and ("list=" in q or "/playlist" in q)
+
+
+# --------------------------- الطابور ---------------------------
+class TrackQueue:
+    # خانات متسلسلة بمساحة فاضية من الجهتين: الإضافة/السحب من الأول والآخر O(1)،
+    # وشجرة فينويك تعد الخانات المشغولة عشان الوصول بالترتيب والحذف يكون O(log n)
+    def __init__(self, items: Iterable[Track] = ()):
+        self._reset(list(items))
+
+    def _reset(self, items: List[Track]):
+        n = len(items)
+        room = max(16, n // 2)
+        self._cap = n + 2 * room
+        self._slots: List[Optional[Track]] = [None] * self._cap
+        self._head = room  # أول خانة مشغولة
+        self._tail = room + n  # بعد آخر خانة مشغولة
+        self._slots[self._head:self._tail] = items
+        self._len = n
+        # بناء الشجرة خطيًا
+        tree = [0] * (self._cap + 1)
+        for i in range(1, self._cap + 1):
+            if self._slots[i - 1] is not None:
+                tree[i] += 1
+            j = i + (i & -i)
+            if j <= self._cap:
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _add(self, slot: int, delta: int):
+        i = slot + 1
+        while i <= self._cap:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _find(self, k: int) -> int:
+        # أصغر خانة قبلها (وهي معها) k+1 عنصر
+        pos, rem = 0, k + 1
+        step = 1 << (self._cap.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= self._cap and self._tree[nxt] < rem:
+                pos = nxt
+                rem -= self._tree[nxt]
+            step >>= 1
+        return pos
+
+    def _slot(self, index: int) -> int:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        if index == 0:
+            return self._head
+        if index == self._len - 1:
+            return self._tail - 1
+        return self._find(index)
+
+    def _remove_slot(self, slot: int) -> Track:
+        track = self._slots[slot]
+        self._slots[slot] = None
+        self._add(slot, -1)
+        self._len -= 1
+        if not self._len:
+            self._reset([])
+            return track
+        while self._slots[self._head] is None:
+            self._head += 1
+        while self._slots[self._tail - 1] is None:
+            self._tail -= 1
+        # خانات فاضية كثير بالنص؟ نرصّها
+        if self._tail - self._head > 2 * self._len + 32:
+            self._reset(list(self))
+        return track
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Track]:
+        slots = self._slots
+        for i in range(self._head, self._tail):
+            if slots[i] is not None:
+                yield slots[i]
+
+    def __getitem__(self, index: int) -> Track:
+        return self._slots[self._slot(index)]
+
+    def peek(self, n: int) -> List[Track]:
+        return list(islice(self, n))
+
+    def append(self, track: Track):
+        if self._tail == self._cap:
+            self._reset(list(self))
+        self._slots[self._tail] = track
+        self._add(self._tail, 1)
+        self._tail += 1
+        self._len += 1
+
+    def appendleft(self, track: Track):
+        if self._head == 0:
+            self._reset(list(self))
+        self._head -= 1
+        self._slots[self._head] = track
+        self._add(self._head, 1)
+        self._len += 1
+
+    def popleft(self) -> Track:
+        if not self._len:
+            raise IndexError("pop from empty queue")
+        return self._remove_slot(self._head)
+
+    def pop(self, index: int = -1) -> Track:
+        return self._remove_slot(self._slot(index))
+
+    def move_to_front(self, index: int) -> Track:
+        track = self.pop(index)
+        self.appendleft(track)
+        return track
+
+    def rotate(self) -> Track:
+        # Loop ALL: المؤشر يتقدم خانة والأغنية تنكتب بآخر الطابور، بدون إزاحة باقي العناصر
+        track = self.popleft()
+        self.append(track)
+        return track
+
+    def shuffle(self):
+        # نخلط القيم داخل نفس الخانات، فالشجرة ما تتغير
+        live = [i for i in range(self._head, self._tail) if self._slots[i] is not None]
+        tracks = [self._slots[i] for i in live]
+        random.shuffle(tracks)
+        for i, track in zip(live, tracks):
+            self._slots[i] = track
+
+    def clear(self):
+        self._reset([])
+
+
+# --------------------------- رسم البانل ---------------------------
+class PanelRenderer:
+    # يجمع طلبات تحديث البانل في تعديل واحد كل PANEL_MIN_INTERVAL، ويتجاهل التعديل لو ما تغير شي
+    def __init__(self, player: "GuildPlayer"):
+        self.player = player
+        self._task: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._text_channel: Optional[discord.TextChannel] = None
+        self._last_edit = 0.0
+        self._last_rendered: Optional[Dict[str, Any]] = None
+
+        self.requested = 0
+        self.edits = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.rate_limited = 0
+
+    def request(self, text_channel: discord.TextChannel):
+        self.requested += 1
+        self._text_channel = text_channel
+        if self._task and not self._task.done():
+            # فيه تعديل جاي أصلًا، بيشمل هذا الطلب
+            self.coalesced += 1
+            PANEL_SKIPPED.inc(guild_bucket(self.player.guild.id), "coalesced")
+            self._dirty = True
+            return
+        self._task = asyncio.create_task(self._run())
+
+    def sent(self, embed: discord.Embed):
+        # البانل انرسل كرسالة جديدة بهذا المحتوى
+        self._last_rendered = embed.to_dict()
+        self._last_edit = asyncio.get_running_loop().time()
+
+    def reset(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        self._dirty = False
+        self._last_rendered = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = self._last_edit + PANEL_MIN_INTERVAL - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._dirty = False
+            await self._flush()
+            if not self._dirty:
+                return
+
+    async def _flush(self):
+        player = self.player
+        if not player.panel_message:
+            return
+        embed = player.build_embed()
+        rendered = embed.to_dict()
+        bucket = guild_bucket(player.guild.id)
+        if rendered == self._last_rendered:
+            self.unchanged += 1
+            PANEL_SKIPPED.inc(bucket, "unchanged")
+            return
+        try:
+            await player.panel_message.edit(embed=embed, view=player.panel_view)
+        except discord.NotFound:
+            # لو انمسحت الرسالة بالغلط، أعد إنشاءها
+            await player._send_panel(self._text_channel)
+            return
+        except discord.HTTPException as e:
+            if e.status != 429:
+                return
+            # ريت لمت: نأجل المحاولة الجاية فترة إضافية
+            self.rate_limited += 1
+            PANEL_SKIPPED.inc(bucket, "rate_limited")
+            self._last_edit = asyncio.get_running_loop().time() + PANEL_MIN_INTERVAL
+            self._dirty = True
+            return
+        self.edits += 1
+        PANEL_EDITS.inc(bucket)
+        self._last_rendered = rendered
+        self._last_edit = asyncio.get_running_loop().time()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requested": self.requested,
+            "edits": self.edits,
+            "saved": self.requested - self.edits,
+            "coalesced": self.coalesced,
+            "unchanged": self.unchanged,
+            "rate_limited": self.rate_limited,
+        }
+
+
+# --------------------------- تشغيل بدون فواصل ---------------------------
+FRAME_BYTES = 3840  # فريم 20ms: ستيريو 48kHz بـ 16bit
+FRAMES_PER_SECOND = 50
+
+
+def _pad(frame: bytes) -> bytes:
+    return frame if len(frame) >= FRAME_BYTES else frame.ljust(FRAME_BYTES, b"\0")
+
+
+class _PyAudioop:
+    # بديل بطيء لـ mul/add على عينات 16bit، لو audioop مو موجود (بايثون 3.13 بدون audioop-lts)
+    @staticmethod
+    def mul(fragment: bytes, width: int, factor: float) -> bytes:
+        # نفس تقريب audioop: floor مو قص
+        return array("h", [max(-32768, min(32767, math.floor(s * factor))) for s in array("h", fragment)]).tobytes()
+
+    @staticmethod
+    def add(a: bytes, b: bytes, width: int) -> bytes:
+        return array("h", [max(-32768, min(32767, x + y)) for x, y in zip(array("h", a), array("h", b))]).tobytes()
+
+
+_audioop: Any = None
+
+
+def _get_audioop():
+    # audioop مهمل من 3.11 وانشال في 3.13، فما نستورده إلا لما الميكسر يشتغل فعلًا (GAPLESS)
+    global _audioop
+    if _audioop is None:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            try:
+                import audioop
+                _audioop = audioop
+            except ImportError:
+                _audioop = _PyAudioop
+    return _audioop
+
+
+class _Prebuffer:
+    # يفك أول ثواني الأغنية الجاية بثريد، بحد أقصى ثابت من الفريمات
+    def __init__(self, source: discord.AudioSource, max_frames: int):
+        self.source = source
+        self._frames: deque = deque()
+        self._max_frames = max_frames
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, name="prebuffer", daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        while not self._stop.is_set() and len(self._frames) < self._max_frames:
+            frame = self.source.read()
+            if not frame:
+                break
+            self._frames.append(frame)
+
+    def read(self) -> bytes:
+        if self._frames:
+            return self._frames.popleft()
+        if self._thread.is_alive():
+            # البفر خلص قبل ما يمتلي: نوقف الثريد ونقرأ مباشرة
+            self._stop.set()
+            self._thread.join()
+            if self._frames:
+                return self._frames.popleft()
+        return self.source.read()
+
+    def cleanup(self):
+        self._stop.set()
+        self.source.cleanup()  # يقتل ffmpeg فتفك القراءة المعلقة
+        self._thread.join(timeout=1)
+
+
+def _cleanup_async(source: discord.AudioSource):
+    # قتل ffmpeg ممكن ياخذ وقت، وما نبغى نأخر ثريد الصوت
+    threading.Thread(target=source.cleanup, daemon=True).start()
+
+
+class MixerSource(discord.AudioSource):
+    # سورس PCM واحد يعيش عبر أكثر من أغنية: لما تخلص الحالية يكمل من البفر حق الجاية بنفس الفريم
+    def __init__(self, source: discord.AudioSource, volume: float, crossfade: float,
+                 on_switch: Callable[[Any], None]):
+        self._current = source
+        self._next: Optional[_Prebuffer] = None
+        self._next_track: Any = None
+        self._countdown = 0  # فريمات باقية على نهاية الحالية (تقدير من المدة)
+        self._fade_frames = int(crossfade * FRAMES_PER_SECOND)
+        self._on_switch = on_switch
+        self._lock = threading.Lock()
+        self._audioop = _get_audioop()
+        self.volume = volume
+
+    def is_opus(self) -> bool:
+        return False
+
+    def arm(self, source: discord.AudioSource, track: Any, remaining: float):
+        with self._lock:
+            self._clear_next()
+            self._next = _Prebuffer(source, int(PREBUFFER_SECONDS * FRAMES_PER_SECOND))
+            self._next_track = track
+            self._countdown = int(remaining * FRAMES_PER_SECOND)
+
+    def clear_next(self):
+        with self._lock:
+            self._clear_next()
+
+    def _clear_next(self):
+        if self._next is not None:
+            _cleanup_async(self._next)
+        self._next = None
+        self._next_track = None
+
+    def _switch(self) -> bytes:
+        old = self._current
+        self._current = self._next
+        track = self._next_track
+        self._next = None
+        self._next_track = None
+        _cleanup_async(old)
+        self._on_switch(track)
+        return self._current.read()
+
+    def read(self) -> bytes:
+        with self._lock:
+            frame = self._current.read()
+            if self._next is not None:
+                self._countdown -= 1
+                if not frame:
+                    frame = self._switch()
+                elif self._fade_frames and self._countdown < self._fade_frames:
+                    incoming = self._next.read()
+                    if incoming:
+                        gain = max(0.0, self._countdown / self._fade_frames)
+                        ops = self._audioop
+                        frame = ops.add(ops.mul(_pad(frame), 2, gain), ops.mul(_pad(incoming), 2, 1.0 - gain), 2)
+        if frame and self.volume != 1.0:
+            frame = self._audioop.mul(frame, 2, self.volume)
+        return frame
+
+    def cleanup(self):
+        with self._lock:
+            self._clear_next()
+            self._current.cleanup()
+
+
+# --------------------------- أوتو بلاي ---------------------------
+# مرشحين من ميكس يوتيوب (RD<id>) ينجلبون سطحيًا بالخلفية أول ما يخلص الطابور،
+# والجاية تنحل قبل نهاية الحالية، فالانتقال ما فيه بحث ولا استخراج
+AUTOPLAY_POOL_LOW = 3  # أقل من كذا نجيب مرشحين جدد
+AUTOPLAY_MIX_ENTRIES = 25
+
+
+def mix_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}&list=RD{video_id}"
+
+
+class AutoplayPool:
+    def __init__(self, player: "GuildPlayer"):
+        self.player = player
+        self.candidates: Deque[Dict[str, Any]] = deque()
+        self.seed_id: Optional[str] = None  # الأغنية اللي جبنا ميكسها
+        self._issued: set = set()  # اللي طلعت من المسبح؛ لو الحالية منها نكمل على نفس الميكس
+        self._fetched: set = set()  # الأغاني اللي جبنا ميكسها من قبل
+
+    def _excluded(self) -> set:
+        p = self.player
+        ids = {t.video_id for t in p.history}
+        ids.update(t.video_id for t in p.queue)
+        if p.current:
+            ids.add(p.current.video_id)
+        return ids
+
+    async def refill(self, seed: Track):
+        if not seed.video_id:
+            return
+        if seed.video_id != self.seed_id and seed.video_id not in self._issued:
+            # المستخدم شغل شي جديد: المرشحين القدام ما عادوا مناسبين
+            self.candidates.clear()
+            self._issued.clear()
+            self._fetched.clear()
+        if len(self.candidates) >= AUTOPLAY_POOL_LOW or seed.video_id in self._fetched:
+            return
+        self.seed_id = seed.video_id
+        self._fetched.add(seed.video_id)
+        excluded = self._excluded()
+        excluded.update(c["id"] for c in self.candidates)
+        async for entry in iter_playlist(mix_url(seed.video_id), self.player.guild.id, AUTOPLAY_MIX_ENTRIES,
+                                         playback=True):
+            if entry["id"] not in excluded:
+                excluded.add(entry["id"])
+                self.candidates.append(entry)
+
+    def take(self, requested_by: Optional[discord.Member]) -> Optional[Track]:
+        # الهستوري يتغير بين الجلب والاختيار، فنفلتر مرة ثانية هنا
+        excluded = self._excluded()
+        while self.candidates:
+            entry = self.candidates.popleft()
+            if entry["id"] not in excluded:
+                self._issued.add(entry["id"])
+                return Track(entry, requested_by)
+        return None
+
+    def clear(self):
+        self.candidates.clear()
+        self._issued.clear()
+        self._fetched.clear()
+        self.seed_id = None
+
+
 # --------------------------- مشغل لكل سيرفر ---------------------------
 class GuildPlayer:
     def __init__(self, guild: discord.Guild):
         self.guild = guild
         self.vc: Optional[discord.VoiceClient] = None
 
-        self.queue: List[Track] = []
-        self.history: List[Track] = []
+        self.queue: TrackQueue = TrackQueue()
+        self.history: Deque[Track] = deque(maxlen=HISTORY_MAX)
 
         self.current: Optional[Track] = None
         self.loop_mode: LoopMode = LoopMode.OFF
@@ -73,116 +842,475 @@ class GuildPlayer:
 
         self._start_mono_time: Optional[float] = None  # لحساب المكان الحالي
         self._start_seek_offset: float = 0.0  # ثواني
+        self._paused_at: Optional[float] = None  # وقت الإيقاف المؤقت، عشان ما ينحسب من المكان
 
         # رسالة البانل وعرض الأزرار
         self.panel_message: Optional[discord.Message] = None
         self.panel_view: Optional["ControlView"] = None
+        self.panel = PanelRenderer(self)
 
-        # قفل لتسلسل التشغيل
-        self.lock = asyncio.Lock()
+        self.text_channel: Optional[discord.TextChannel] = None
 
-    # -------- أدوات السورس/الصوت --------
-    def _build_ffmpeg_options(self, seek_seconds: float = 0.0) -> str:
-        afilters = []
-        # فوليوم
-        afilters.append(f"volume={self.volume}")
-        # استريو افتراضي — لا حاجة لفلاتر ثانية
-        filters_str = ",".join(afilters)
-        opts = f"-vn -af {filters_str}"
-        if seek_seconds > 0:
-            # سنستخدم before_options للseek المبكر
-            pass
-        return opts
+        # كل التشغيل يمشي من تاسك واحد يقرأ الأحداث بالترتيب، وثريد الصوت ما ينتظر أحد
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._runner: Optional[asyncio.Task] = None
+        self._generation = 0  # رقم السورس الحالي؛ نهاية سورس قديم (بعد seek/previous) تنتجاهل
+
+        # زمن الانتقال: من نهاية السورس لين يبدأ اللي بعده
+        self.transition_times: Deque[float] = deque(maxlen=256)
+        self.transitions_over_budget = 0
+        self._mixer: Optional[MixerSource] = None  # بوضع GAPLESS فقط
+
+        # للتنظيف: آخر نشاط، ومن متى الروم فاضي
+        self.last_active = time.monotonic()
+        self._empty_since: Optional[float] = None
 
-    def _make_source(self, url: str, seek_seconds: float = 0.0) -> discord.FFmpegPCMAudio:
-        before = FFMPEG_BEFORE
+        # تجهيز روابط الأغاني الجاية بالخلفية قبل ما تخلص الحالية
+        self._preload_task: Optional[asyncio.Task] = None
+        self._autoplay_next: Optional[Track] = None
+        self._recoveries = 0  # كم مرة رجعنا الأغنية الحالية بعد انقطاع الستريم
+        self.autoplay_pool = AutoplayPool(self)
+
+    # -------- أدوات السورس/الصوت --------
+    def _build_ffmpeg_options(self) -> str:
+        # الفوليوم صار داخل البايثون (PCMVolumeTransformer) عشان نغيره بدون ffmpeg جديد،
+        # والـ seek في before_options
+        return "-vn"
+
+    def _make_source(self, track: Track, seek_seconds: float = 0.0, raw_pcm: bool = False) -> discord.AudioSource:
+        src, before, acodec = track.stream_url, FFMPEG_BEFORE, track.acodec
+        cached = audio_cache.path_for(track.video_id) if audio_cache else None
+        if cached:
+            # ملف محلي: بدون خيارات إعادة الاتصال، والـ seek فوري
+            src, before, acodec = cached, "", "opus"
         if seek_seconds > 0:
             # -ss في before_options يحسن سرعة الـ seek للستريم
-            before = f"{FFMPEG_BEFORE} -ss {int(seek_seconds)}"
-        options = self._build_ffmpeg_options(seek_seconds)
-        return discord.FFmpegPCMAudio(url, before_options=before, options=options)
+            before = f"{before} -ss {int(seek_seconds)}".strip()
+        if AUDIO_MODE == "opus" and self.volume == 1.0 and not raw_pcm and not VOLUME_INSTANT:
+            # passthrough: أوبوس يوتيوب ينرسل كما هو بدون أي ترميز.
+            # لو الصيغة مو أوبوس، ffmpeg يرمّز libopus بنفسه بدل الترميز داخل البايثون
+            codec = "opus" if acodec == "opus" else None
+            FFMPEG_SPAWNS.inc("passthrough" if codec else "opus_encode")
+            return discord.FFmpegOpusAudio(src, codec=codec, before_options=before, options="-vn")
+        # الفوليوم يحتاج فك الصوت، فنرجع لـ PCM ونطبقه داخل البايثون ليصير قابل للتغيير مباشرة
+        options = self._build_ffmpeg_options()
+        FFMPEG_SPAWNS.inc("pcm")
+        pcm = discord.FFmpegPCMAudio(src, before_options=before, options=options)
+        if raw_pcm:
+            return pcm
+        return discord.PCMVolumeTransformer(pcm, volume=self.volume)
 
     def _elapsed(self) -> float:
         if self._start_mono_time is None:
             return 0.0
-        return (asyncio.get_running_loop().time() - self._start_mono_time)
+        now = self._paused_at if self._paused_at is not None else asyncio.get_running_loop().time()
+        return now - self._start_mono_time
 
-    # -------- تشغيل/تنقل --------
-    async def enqueue_and_maybe_play(self, track: Track, text_channel: discord.TextChannel):
-        self.queue.append(track)
-        # إذا لا يوجد شيء يشغل الآن، ابدأ فورًا
-        if not self.is_playing():
-            await self._play_next(text_channel)
-        else:
-            await self.update_panel(text_channel)
+    def _mark_started(self, offset: float = 0.0):
+        # بداية تشغيل سورس جديد من الثانية offset
+        self._start_seek_offset = offset
+        self._start_mono_time = asyncio.get_running_loop().time()
+        self._paused_at = None
+
+    def position(self) -> float:
+        return self._start_seek_offset + self._elapsed()
+
+    # -------- تجهيز مسبق --------
+    def schedule_preload(self):
+        # يُنادى عند بداية كل أغنية وعند أي تغيير بالطابور (قفز/خلط/إضافة)
+        if self._mixer:
+            # الجاية ممكن تغيرت؛ التجهيز يعيد تسليحها
+            self._mixer.clear_next()
+        if self._preload_task and not self._preload_task.done():
+            self._preload_task.cancel()
+        self._preload_task = None
+        if self.current:
+            self._preload_task = asyncio.create_task(self._preload())
 
-    async def _play_next(self, text_channel: discord.TextChannel):
-        async with self.lock:
-            next_track: Optional[Track] = None
+    def cancel_preload(self):
+        if self._preload_task and not self._preload_task.done():
+            self._preload_task.cancel()
+        self._preload_task = None
 
-            if self.loop_mode == LoopMode.ONE and self.current:
-                next_track = self.current
-            else:
-                # إذا انتهت الحالية، أرسلها للهستوري
-                if self.current and (not self.history or self.history[-1] != self.current):
-                    self.history.append(self.current)
-
-                if self.queue:
-                    # Loop ALL: بعد سحب أول عنصر، نضيفه نهاية الطابور لاحقًا
-                    next_track = self.queue.pop(0)
-                    if self.loop_mode == LoopMode.ALL:
-                        self.queue.append(next_track)
-                elif self.autoplay and self.current:
-                    # أوتو بلاي بسيط: ابحث عن أغنية مشابهة بالعنوان
-                    query = f"{self.current.title}"
-                    try:
-                        info = await fetch_yt_info(query)
-                        next_track = Track(info, self.current.requested_by)
-                    except Exception:
-                        next_track = None
+    async def _refresh_track(self, track: Track, within: float = 0.0, force: bool = False):
+        if audio_cache and audio_cache.has_file(track.video_id):
+            return
+        if not force and track.is_fresh(within):
+            return
+        within = min(within, STREAM_FRESH_MAX)
+        if force:
+            # الرابط الحالي فشل: لا يرجع نفسه من الكاش
+            resolve_cache.invalidate(normalize_query(track.webpage_url))
+        STREAM_REFRESHES.inc("forced" if force else "expired" if track.stream_url else "unresolved")
+        track.refresh(await fetch_yt_info(track.webpage_url, self.guild.id, fresh_for=within, playback=True))
+
+    async def _preload(self):
+        try:
+            wants_autoplay = not self.queue and self.autoplay and self.current and self._autoplay_next is None
+            if wants_autoplay:
+                # المرشحين من بداية الأغنية (استخراج سطحي)، والحل الكامل بعدين قرب النهاية
+                await self.autoplay_pool.refill(self.current)
+            remaining = 0.0
+            if self.current and self.current.duration:
+                remaining = max(0.0, self.current.duration - self.position())
+                await asyncio.sleep(max(0.0, remaining - PRELOAD_LEAD))
+            # كل أغنية لازم رابطها يبقى صالح لين تخلص هي
+            starts_in = remaining
+            for track in self.queue.peek(PRELOAD_COUNT):
+                await self._refresh_track(track, within=starts_in + (track.duration or 0))
+                starts_in += track.duration or 0
+            if wants_autoplay and not self.queue:
+                self._autoplay_next = await self._next_autoplay(within=starts_in)
+            if self._mixer and self.current and self.current.duration:
+                await self._arm_mixer()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # فشل التجهيز مو مشكلة، _play_next بيجيب الرابط وقتها
+            pass
 
-            if next_track is None:
-                # لا يوجد شيء -> نظف
-                self.current = None
-                await self.stop_and_cleanup_panel()
-                return
+    async def _next_autoplay(self, within: float = 0.0) -> Optional[Track]:
+        # أول مرشح ينحل بنجاح (بعض عناصر الميكس محذوفة أو محجوبة)
+        requested_by = self.current.requested_by if self.current else None
+        for _ in range(AUTOPLAY_POOL_LOW):
+            track = self.autoplay_pool.take(requested_by)
+            if track is None:
+                return None
+            try:
+                await self._refresh_track(track, within=within)
+                return track
+            except Exception:
+                continue
+        return None
+
+    def _peek_next(self) -> Optional[Track]:
+        # نفس اختيار _pick_next بدون ما نغير الطابور
+        if self.loop_mode == LoopMode.ONE and self.current:
+            return self.current
+        if self.queue:
+            return self.queue[0]
+        if self.autoplay:
+            return self._autoplay_next
+        return None
+
+    async def _arm_mixer(self):
+        # نبدأ نفك الجاية قبل النهاية بوقت البفر + الـ crossfade
+        remaining = self.current.duration - self.position()
+        await asyncio.sleep(max(0.0, remaining - PREBUFFER_SECONDS - CROSSFADE_SECONDS))
+        next_track = self._peek_next()
+        if next_track is None or self._mixer is None:
+            return
+        await self._refresh_track(next_track, within=next_track.duration or 0)
+        remaining = max(0.0, self.current.duration - self.position())
+        self._mixer.arm(self._make_source(next_track, raw_pcm=True), next_track, remaining)
 
-            self.current = next_track
-            self._start_seek_offset = 0.0
-            self._start_mono_time = asyncio.get_running_loop().time()
+    # -------- الأحداث --------
+    def post(self, event: PlayerEvent, *args):
+        self.last_active = time.monotonic()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        self._events.put_nowait((event, args))
 
-            # تأكد من وجود اتصال صوتي
-            if not self.vc or not self.vc.is_connected():
-                # سيتم حضور/الاتصال من الخارج قبل نداء هذه الدالة عادةً
-                return
+    def _after_callback(self, generation: int):
+        loop = asyncio.get_running_loop()
+
+        def _after(error):
+            # هذا الكولباك يعمل في ثريد الصوت: نرمي الحدث للوب ونرجع فورًا
+            # (عبر post عشان لو تاسك الأحداث مات يرجع يشتغل)
+            try:
+                loop.call_soon_threadsafe(self.post, PlayerEvent.TRACK_END, generation, error, time.monotonic())
+            except RuntimeError:
+                pass  # اللوب انقفل
+
+        return _after
 
-            source = self._make_source(self.current.stream_url, seek_seconds=0.0)
+    def _switch_callback(self, generation: int):
+        loop = asyncio.get_running_loop()
 
-            def _after_playing(error):
-                # هذا الكولباك يعمل في ثريد مختلف، لازم نعيده لللوب
-                fut = asyncio.run_coroutine_threadsafe(self._on_track_end(text_channel, error), bot.loop)
+        def _switched(track: Track):
+            # ثريد الصوت: الميكسر دخل الأغنية الجاية، نحدث الحالة باللوب
+            try:
+                loop.call_soon_threadsafe(self.post, PlayerEvent.ADVANCED, generation, track)
+            except RuntimeError:
+                pass
+
+        return _switched
+
+    async def _run(self):
+        handlers = {
+            PlayerEvent.PLAY: self._on_play,
+            PlayerEvent.TRACK_END: self._on_track_end,
+            PlayerEvent.SKIP: self._on_skip,
+            PlayerEvent.PREVIOUS: self._on_previous,
+            PlayerEvent.SEEK: self._on_seek,
+            PlayerEvent.VOLUME: self._on_volume,
+            PlayerEvent.STOP: self._on_stop,
+            PlayerEvent.ADVANCED: self._on_advanced,
+            PlayerEvent.RESTORE: self._on_restore,
+        }
+        bucket = guild_bucket(self.guild.id)
+        while True:
+            event, args = await self._events.get()
+            started = time.perf_counter()
+            try:
+                await handlers[event](*args)
+            except asyncio.CancelledError:
+                # إلغاء التاسك نفسه (close) يوقفه؛ إلغاء وصل من شي ينتظره الهاندلر ما يقتله
+                if asyncio.current_task().cancelling():
+                    raise
+                print(f"⚠️ [{self.guild.id}] انلغى {event.name}")
+            except Exception as e:
+                print(f"⚠️ [{self.guild.id}] فشل {event.name}: {e!r}")
+            if state_store:
+                state_store.mark(self)
+            PLAYER_EVENT_SECONDS.observe(time.perf_counter() - started, bucket, event.name)
+
+    def _record_transition(self, seconds: float):
+        TRANSITION_SECONDS.observe(seconds, guild_bucket(self.guild.id))
+        self.transition_times.append(seconds)
+        if seconds > TRANSITION_BUDGET:
+            self.transitions_over_budget += 1
+            TRANSITIONS_OVER_BUDGET.inc(guild_bucket(self.guild.id))
+
+    # -------- تشغيل/تنقل (داخل تاسك الأحداث) --------
+    def _halt(self):
+        # وقف السورس الحالي بدون ما تنحسب نهايته كنهاية أغنية
+        self._generation += 1
+        self._mixer = None
+        if self.vc and (self.vc.is_playing() or self.vc.is_paused()):
+            self.vc.stop()
+
+    async def _start(self, track: Track, offset: float = 0.0, keep_paused: bool = False,
+                     ended_at: Optional[float] = None, recovering: bool = False):
+        # الرابط لازم يعيش لين تخلص الأغنية من هذا المكان؛ التكرار/السابق/التقديم ما يعيدون
+        # الاستخراج إذا الرابط صالح، والسورس القديم يكمل لين يجي الجديد
+        try:
+            await self._refresh_track(track, within=max(0.0, (track.duration or 0) - offset))
+        except Exception:
+            if not track.stream_url:
+                raise
+            # ما قدرنا نجدد: نجرب الرابط القديم، ولو انقطع يمسكه _recover_stream
+        if not recovering:
+            self._recoveries = 0
+        self.last_active = time.monotonic()
+        was_paused = keep_paused and self.vc.is_paused()
+        self._halt()
+        self.current = track
+        self._mark_started(offset)
+        if audio_cache and not offset:
+            audio_cache.note_play(track)
+        if GAPLESS:
+            pcm = self._make_source(track, seek_seconds=offset, raw_pcm=True)
+            source = self._mixer = MixerSource(
+                pcm, self.volume, CROSSFADE_SECONDS, self._switch_callback(self._generation)
+            )
+        else:
+            source = self._make_source(track, seek_seconds=offset)
+        self.vc.play(source, after=self._after_callback(self._generation))
+        if ended_at is not None:
+            self._record_transition(time.monotonic() - ended_at)
+        if was_paused:
+            self.vc.pause()
+            self._paused_at = asyncio.get_running_loop().time()
+        self.schedule_preload()
+        if self.text_channel:
+            await self.show_or_update_panel(self.text_channel)
+
+    async def _pick_next(self) -> Optional[Track]:
+        # يحدد الجاية ويحدث الطابور/الهستوري
+        next_track: Optional[Track] = None
+
+        if self.loop_mode == LoopMode.ONE and self.current:
+            next_track = self.current
+        else:
+            # إذا انتهت الحالية، أرسلها للهستوري
+            if self.current and (not self.history or self.history[-1] != self.current):
+                self.history.append(self.current)
+
+            if self.queue:
+                # Loop ALL: بعد سحب أول عنصر، نضيفه نهاية الطابور لاحقًا
+                if self.loop_mode == LoopMode.ALL:
+                    next_track = self.queue.rotate()
+                else:
+                    next_track = self.queue.popleft()
+            elif self.autoplay and self._autoplay_next:
+                # جهزناها بالخلفية أثناء الأغنية الحالية
+                next_track = self._autoplay_next
+            elif self.autoplay and self.current:
+                # التجهيز ما لحق (الأغنية قصيرة أو انضغط تخطي بدري)
                 try:
-                    fut.result()
+                    await self.autoplay_pool.refill(self.current)
+                    next_track = await self._next_autoplay()
                 except Exception:
-                    pass
-
-            self.vc.play(source, after=_after_playing)
-            await self.show_or_update_panel(text_channel)
+                    next_track = None
+        self._autoplay_next = None
+        return next_track
+
+    async def _play_next(self, ended_at: Optional[float] = None):
+        # تأكد من وجود اتصال صوتي
+        if not self.vc or not self.vc.is_connected():
+            # سيتم حضور/الاتصال من الخارج قبل نداء هذه الدالة عادةً
+            return
 
-    async def _on_track_end(self, text_channel: discord.TextChannel, error: Optional[Exception]):
-        # عند انتهاء المقطع
+        # عادةً التجهيز المسبق جدد الرابط؛ _start يجدده لو ما لحق، ولو فشل نتخطاها للي بعدها.
+        # نجرب كل اللي بالطابور (+ الحالية بالتكرار/أوتو بلاي)، فالحد يمنع بس اللف للأبد
+        for _ in range(len(self.queue) + 2):
+            next_track = await self._pick_next()
+            if next_track is None:
+                break
+            try:
+                await self._start(next_track, ended_at=ended_at)
+                return
+            except Exception as e:
+                print(f"⚠️ [{self.guild.id}] تعذر تشغيل {next_track.title}: {e!r}")
+                if self.text_channel:
+                    notify(self.text_channel, f"تعذر تشغيل **{next_track.title}**، تم تخطيها.")
+
+        # لا يوجد شيء -> نظف
+        self.current = None
+        self.cancel_preload()
+        self._halt()
+        await self.delete_panel()
+
+    async def _on_play(self):
+        if not self.is_active():
+            await self._play_next()
+
+    async def _on_track_end(self, generation: int, error: Optional[Exception], ended_at: float):
+        if generation != self._generation:
+            return  # سورس انستبدل، مو نهاية حقيقية
+        # المكان وقت ما خلص السورس فعلًا، مو وقت ما وصلنا الحدث
+        position = self.position() - max(0.0, time.monotonic() - ended_at)
+        # الخمول يبدأ من نهاية آخر أغنية، مو من آخر ضغطة
+        self.last_active = time.monotonic()
         self._start_mono_time = None
-        if error:
+        self._paused_at = None
+        if await self._recover_stream(position):
+            return
+        if error and self.text_channel:
             try:
-                await text_channel.send(f"حدث خطأ أثناء التشغيل: `{error}`")
+                await self.text_channel.send(f"حدث خطأ أثناء التشغيل: `{error}`")
             except Exception:
                 pass
         # إذا لا يوجد شيء يشغل بعده -> سيحذف البانل داخل _play_next
-        await self._play_next(text_channel)
+        await self._play_next(ended_at)
+
+    async def _recover_stream(self, position: float) -> bool:
+        # السورس خلص قبل نهاية الأغنية بكثير: غالبًا الرابط انتهى وffmpeg أخذ 403
+        track = self.current
+        if track is None or not track.duration or position >= track.duration - STREAM_EARLY_END:
+            return False
+        if self._recoveries >= STREAM_RECOVER_MAX:
+            STREAM_RECOVERIES.inc("gave_up")
+            return False
+        self._recoveries += 1
+        try:
+            await self._refresh_track(track, within=track.duration - position, force=True)
+            await self._start(track, float(int(max(0.0, position))), recovering=True)
+        except Exception as e:
+            print(f"⚠️ [{self.guild.id}] تعذر استرجاع الستريم: {e!r}")
+            STREAM_RECOVERIES.inc("failed")
+            return False
+        STREAM_RECOVERIES.inc("resumed")
+        return True
+
+    async def _on_advanced(self, generation: int, track: Track):
+        if generation != self._generation or self._mixer is None:
+            return
+        next_track = await self._pick_next()
+        if next_track is not track:
+            # الطابور تغير بين التسليح والانتقال: شغل الصحيحة بالطريقة العادية
+            if next_track is None:
+                self.current = None
+                self.cancel_preload()
+                self._halt()
+                await self.delete_panel()
+            else:
+                await self._start(next_track)
+            return
+        self.current = track
+        self._mark_started(0.0)
+        self._record_transition(0.0)
+        if audio_cache:
+            audio_cache.note_play(track)
+        self.schedule_preload()
+        if self.text_channel:
+            await self.update_panel(self.text_channel)
+
+    async def _on_skip(self):
+        if self.current:
+            await self._play_next(time.monotonic())
+
+    async def _on_previous(self):
+        if not self.history or not self.vc:
+            return
+        prev_track = self.history.pop()
+        if self.current:
+            # رجّع الحالية لأول الطابور
+            self.queue.appendleft(self.current)
+        await self._start(prev_track)
+
+    async def _on_seek(self, seconds: int):
+        # تقديم/ترجيع
+        if not self.current or not self.vc:
+            return
+        new_pos = max(0, int(self.position()) + seconds)
+        await self._start(self.current, float(new_pos), keep_paused=True)
+
+    async def _on_volume(self):
+        if not self.current or not self.vc:
+            return
+        source = self.vc.source
+        if isinstance(source, (discord.PCMVolumeTransformer, MixerSource)):
+            # تغيير مباشر بدون ffmpeg جديد ولا اتصال جديد
+            source.volume = self.volume
+        elif source is not None:
+            # سورس passthrough ما يقبل فوليوم: نبدله مرة وحدة لـ PCM من نفس المكان.
+            # الأغاني الجاية تبدأ PCM دام الفوليوم مو 100%، وVOLUME_INSTANT يلغي هالحالة كليًا
+            await self._start(self.current, float(int(self.position())), keep_paused=True)
+
+    async def _on_restore(self, track: Track, offset: float, paused: bool):
+        if self.is_active():
+            return
+        if track.duration and offset >= track.duration:
+            offset = 0.0
+        try:
+            await self._start(track, offset)
+        except Exception as e:
+            print(f"⚠️ [{self.guild.id}] تعذر جلب الأغنية المحفوظة: {e!r}")
+            await self._play_next()
+            return
+        if paused:
+            self.vc.pause()
+            self._paused_at = asyncio.get_running_loop().time()
+
+    async def _on_stop(self):
+        self.queue.clear()
+        self.current = None
+        self.cancel_preload()
+        self._halt()
+        await self.delete_panel()
+
+    # -------- واجهة الأزرار/الأوامر --------
+    async def enqueue_and_maybe_play(self, track: Track, text_channel: discord.TextChannel):
+        self.text_channel = text_channel
+        self.last_active = time.monotonic()
+        self.queue.append(track)
+        # إذا لا يوجد شيء يشغل الآن، ابدأ فورًا
+        if not self.is_active():
+            self.post(PlayerEvent.PLAY)
+        else:
+            if len(self.queue) <= PRELOAD_COUNT:
+                self.schedule_preload()
+            await self.update_panel(text_channel)
 
     def is_playing(self) -> bool:
         return self.vc and self.vc.is_connected() and self.vc.is_playing()
 
+    def is_active(self) -> bool:
+        # شغال أو موقف مؤقتًا
+        return bool(self.vc and self.vc.is_connected() and (self.vc.is_playing() or self.vc.is_paused()))
+
     async def ensure_connected(self, member: discord.Member):
         # اتصل بنفس روم العضو
         if member.voice and member.voice.channel:
@@ -196,76 +1324,37 @@ class GuildPlayer:
 
     async def pause_resume(self):
         if self.vc:
+            now = asyncio.get_running_loop().time()
             if self.vc.is_paused():
                 self.vc.resume()
+                # وقت الإيقاف ما ينحسب من مكان الأغنية
+                if self._paused_at is not None and self._start_mono_time is not None:
+                    self._start_mono_time += now - self._paused_at
+                self._paused_at = None
             elif self.vc.is_playing():
                 self.vc.pause()
+                self._paused_at = now
 
-    async def stop_and_cleanup_panel(self):
-        # وقف ومسح البانل إذا مافي طابور
-        if self.vc and (self.vc.is_playing() or self.vc.is_paused()):
-            self.vc.stop()
-        if not self.queue and not self.current:
-            # امسح البانل
-            await self.delete_panel()
+    async def stop(self):
+        self.post(PlayerEvent.STOP)
 
     async def skip(self):
-        if self.vc and (self.vc.is_playing() or self.vc.is_paused()):
-            self.vc.stop()
+        self.post(PlayerEvent.SKIP)
 
     async def previous(self, text_channel: discord.TextChannel):
-        if not self.history:
-            return
-        prev_track = self.history.pop()
-        if self.current:
-            # رجّع الحالية لأول الطابور
-            self.queue.insert(0, self.current)
-        self.current = prev_track
-        self._start_seek_offset = 0.0
-        self._start_mono_time = asyncio.get_running_loop().time()
-
-        # شغّلها
-        source = self._make_source(self.current.stream_url, 0.0)
-
-        def _after(error):
-            fut = asyncio.run_coroutine_threadsafe(self._on_track_end(text_channel, error), bot.loop)
-            try:
-                fut.result()
-            except Exception:
-                pass
-
-        self.vc.play(source, after=_after)
-        await self.show_or_update_panel(text_channel)
+        self.text_channel = text_channel
+        self.post(PlayerEvent.PREVIOUS)
 
     async def seek(self, seconds: int, text_channel: discord.TextChannel):
-        # تقديم/ترجيع
-        if not self.current or not self.vc:
-            return
-        elapsed = self._start_seek_offset + self._elapsed()
-        new_pos = max(0, int(elapsed) + seconds)
-        self._start_seek_offset = float(new_pos)
-        self._start_mono_time = asyncio.get_running_loop().time()
-        src = self._make_source(self.current.stream_url, seek_seconds=new_pos)
-
-        def _after(error):
-            fut = asyncio.run_coroutine_threadsafe(self._on_track_end(text_channel, error), bot.loop)
-            try:
-                fut.result()
-            except Exception:
-                pass
-
-        self.vc.play(src, after=_after)
-        await self.update_panel(text_channel)
+        self.text_channel = text_channel
+        self.post(PlayerEvent.SEEK, seconds)
 
     async def set_volume(self, delta: float, text_channel: discord.TextChannel):
         # delta +0.1/-0.1
-        self.volume = float(min(2.0, max(0.0, self.volume + delta)))
-        # أعد إنشاء السورس للحجم الجديد مع المحافظة على الموضع
-        if self.current and self.vc:
-            pos = self._start_seek_offset + self._elapsed()
-            await self.seek(0, text_channel)  # سيُعاد بناؤه بنفس الموضع عبر _make_source
-            self._start_seek_offset = pos
-            await self.seek(0, text_channel)
+        # التقريب يخلي 100% ترجع 1.0 بالضبط (يهم لمسار الـ passthrough)
+        self.volume = round(min(2.0, max(0.0, self.volume + delta)), 2)
+        self.text_channel = text_channel
+        self.post(PlayerEvent.VOLUME)
 
     # -------- البانل --------
     def build_embed(self) -> discord.Embed:
@@ -276,8 +1365,8 @@ class GuildPlayer:
                 e.url = self.current.webpage_url
             
             # إضافة صورة المقطع
-            if self.current.info.get("thumbnail"):
-                e.set_thumbnail(url=self.current.info["thumbnail"])
+            if self.current.thumbnail:
+                e.set_thumbnail(url=self.current.thumbnail)
             
             # إضافة معلومات إضافية
             if self.current.duration:
@@ -288,12 +1377,12 @@ class GuildPlayer:
                 e.add_field(name="👤 طلب بواسطة", value=self.current.requested_by.display_name, inline=True)
                 
             # إضافة خط وكت المقطع
-            if self.current.info.get("uploader"):
-                e.add_field(name="📺 القناة", value=self.current.info["uploader"], inline=True)
+            if self.current.uploader:
+                e.add_field(name="📺 القناة", value=self.current.uploader, inline=True)
                 
             # إضافة عدد المشاهدات إذا كان متوفر
-            if self.current.info.get("view_count"):
-                view_count = self.current.info["view_count"]
+            if self.current.view_count:
+                view_count = self.current.view_count
                 if view_count > 1000000:
                     view_str = f"{view_count/1000000:.1f}M"
                 elif view_count > 1000:
@@ -316,27 +1405,73 @@ class GuildPlayer:
         if self.panel_message and self.panel_view:
             await self.update_panel(text_channel)
             return
+        await self._send_panel(text_channel)
+
+    async def _send_panel(self, text_channel: discord.TextChannel):
+        if self.panel_view:
+            self.panel_view.stop()
         self.panel_view = ControlView(self, text_channel)
-        self.panel_message = await text_channel.send(embed=self.build_embed(), view=self.panel_view)
+        embed = self.build_embed()
+        self.panel_message = await text_channel.send(embed=embed, view=self.panel_view)
+        self.panel.sent(embed)
 
     async def update_panel(self, text_channel: discord.TextChannel):
+        # كل تغيير بالأزرار يمر من هنا، فنعلم الحالة للحفظ
+        if state_store:
+            state_store.mark(self)
+        # ما نعدل فورًا؛ الرندرر يجمع الطلبات المتتالية في تعديل واحد
         if self.panel_message:
-            try:
-                await self.panel_message.edit(embed=self.build_embed(), view=self.panel_view)
-            except discord.NotFound:
-                # لو انمسحت الرسالة بالغلط، أعد إنشاءها
-                self.panel_view = ControlView(self, text_channel)
-                self.panel_message = await text_channel.send(embed=self.build_embed(), view=self.panel_view)
+            self.panel.request(text_channel)
 
     async def delete_panel(self):
+        self.panel.reset()
         if self.panel_message:
             try:
                 await self.panel_message.delete()
             except Exception:
                 pass
+        if self.panel_view:
+            # يشيل الفيو من مخزن الفيوهات حق المكتبة، وإلا يبقى عايش للأبد (timeout=None)
+            self.panel_view.stop()
         self.panel_message = None
         self.panel_view = None
 
+    # -------- التنظيف --------
+    def idle_reason(self, now: float) -> Optional[str]:
+        if not self.vc or not self.vc.is_connected():
+            # انفصل ومحد استخدمه من فترة
+            return "disconnected" if now - self.last_active > REAPER_INTERVAL else None
+        if not any(not m.bot for m in self.vc.channel.members):
+            if self._empty_since is None:
+                self._empty_since = now
+            elif now - self._empty_since > EMPTY_TIMEOUT:
+                return "empty"
+        else:
+            self._empty_since = None
+        if not self.is_active() and now - self.last_active > IDLE_TIMEOUT:
+            return "idle"
+        return None
+
+    async def close(self):
+        # فك كل شي: التاسكات، السورس، البانل، الاتصال الصوتي
+        self.cancel_preload()
+        if self._runner and not self._runner.done():
+            self._runner.cancel()
+        self._runner = None
+        self._halt()
+        self.queue.clear()
+        self.history.clear()
+        self.current = None
+        self._autoplay_next = None
+        self.autoplay_pool.clear()
+        await self.delete_panel()
+        if self.vc:
+            try:
+                await self.vc.disconnect(force=True)
+            except Exception:
+                pass
+        self.vc = None
+
 
 # --------------------------- View (الأزرار) ---------------------------
 class ControlView(discord.ui.View):
@@ -358,11 +1493,10 @@ class ControlView(discord.ui.View):
         await self.player.previous(self.text_channel)
 
     @discord.ui.button(label="إيقاف التشغيل", style=discord.ButtonStyle.danger, emoji="⏹️", row=0)
-    async def stop(self, interaction: discord.Interaction, button: discord.ui.Button):
+    async def stop_music(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # الاسم مو stop عشان ما يغطي View.stop
         await interaction.response.defer(thinking=False)
-        self.player.queue.clear()
-        self.player.current = None
-        await self.player.stop_and_cleanup_panel()
+        await self.player.stop()
 
     @discord.ui.button(label="تخطي الأغنية", style=discord.ButtonStyle.primary, emoji="⏭️", row=0)
     async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -385,6 +1519,7 @@ class ControlView(discord.ui.View):
     async def autoplay(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(thinking=False)
         self.player.autoplay = not self.player.autoplay
+        self.player.schedule_preload()
         await self.player.update_panel(self.text_channel)
 
     @discord.ui.button(label="إيقاف/استئناف", style=discord.ButtonStyle.primary, emoji="⏯️", row=1)
@@ -400,6 +1535,7 @@ class ControlView(discord.ui.View):
         order = [LoopMode.OFF, LoopMode.ONE, LoopMode.ALL]
         idx = order.index(self.player.loop_mode)
         self.player.loop_mode = order[(idx + 1) % len(order)]
+        self.player.schedule_preload()
         await self.player.update_panel(self.text_channel)
 
     @discord.ui.button(label="تقديم 10 ثانية", style=discord.ButtonStyle.secondary, emoji="⏩", row=1)
@@ -414,14 +1550,15 @@ class ControlView(discord.ui.View):
         if not self.player.queue:
             await interaction.followup.send("الطابور فارغ.", ephemeral=True)
             return
-        text = "\n".join([f"{i+1}. {t.title}" for i, t in enumerate(self.player.queue[:20])])
+        text = "\n".join([f"{i+1}. {t.title}" for i, t in enumerate(self.player.queue.peek(20))])
         await interaction.followup.send(f"**الطابور:**\n{text}", ephemeral=True)
 
     @discord.ui.button(label="إضافة السابقة", style=discord.ButtonStyle.secondary, emoji="🔂", row=2)
     async def add_previous(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(thinking=False)
         if self.player.history:
-            self.player.queue.insert(0, self.player.history[-1])
+            self.player.queue.appendleft(self.player.history[-1])
+            self.player.schedule_preload()
             await self.player.update_panel(self.text_channel)
 
     @discord.ui.button(label="تشغيل الموسيقى", style=discord.ButtonStyle.success, emoji="▶️", row=2)
@@ -440,16 +1577,20 @@ class ControlView(discord.ui.View):
 
         # صنع Select ديناميكي
         options = []
-        for i, t in enumerate(self.player.queue[:25]):
+        for i, t in enumerate(self.player.queue.peek(25)):
             options.append(discord.SelectOption(label=f"{i+1}. {t.title[:90]}", value=str(i)))
 
         select = discord.ui.Select(placeholder="اختر أغنية للقفز إليها", options=options)
 
         async def select_callback(interact: discord.Interaction):
             idx = int(select.values[0])
+            if idx >= len(self.player.queue):
+                # الطابور تغير بعد ما انفتحت القائمة
+                await interact.response.send_message("الأغنية ما عادت في الطابور.", ephemeral=True)
+                return
             # انقل المختارة لبداية الطابور و Skip الحالي
-            chosen = self.player.queue.pop(idx)
-            self.player.queue.insert(0, chosen)
+            chosen = self.player.queue.move_to_front(idx)
+            self.player.schedule_preload()
             await interact.response.send_message(f"تم القفز إلى: **{chosen.title}**", ephemeral=True)
             await self.player.skip()
 
@@ -461,10 +1602,55 @@ class ControlView(discord.ui.View):
     @discord.ui.button(label="خلط الطابور", style=discord.ButtonStyle.secondary, emoji="🔀", row=2)
     async def shuffle_queue(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(thinking=False)
-        random.shuffle(self.player.queue)
+        self.player.queue.shuffle()
+        self.player.schedule_preload()
         await self.player.update_panel(self.text_channel)
 
 
+def _format_duration(seconds: Optional[float]) -> Optional[str]:
+    if not seconds:
+        return None
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class SearchView(discord.ui.View):
+    # نتايج "ابحث": صاحب البحث يختار، والمختارة تنضاف بدون رابط وتنحل قبل دورها
+    def __init__(self, requester: discord.Member, results: List[Dict[str, Any]]):
+        super().__init__(timeout=60)
+        self.requester = requester
+        self.results = results
+        self.message: Optional[discord.Message] = None
+
+        options = []
+        for i, r in enumerate(results):
+            options.append(discord.SelectOption(
+                label=f"{i+1}. {r['title'][:90]}",
+                description=" • ".join(filter(None, [_format_duration(r.get("duration")), r.get("uploader")]))[:100] or None,
+                value=str(i),
+            ))
+        self.select = discord.ui.Select(placeholder="اختر أغنية للتشغيل", options=options)
+        self.select.callback = self.choose
+        self.add_item(self.select)
+
+    async def choose(self, interaction: discord.Interaction):
+        if interaction.user.id != self.requester.id:
+            await interaction.response.send_message("هذا البحث مو لك.", ephemeral=True)
+            return
+        await interaction.response.defer(thinking=False)
+        self.stop()
+        if self.message:
+            spawn_background(_delete_quietly(self.message))
+        entry = self.results[int(self.select.values[0])]
+        player = await _connect_player(interaction.guild, interaction.user, interaction.channel)
+        if player:
+            await player.enqueue_and_maybe_play(Track(entry, interaction.user), interaction.channel)
+
+    async def on_timeout(self):
+        if self.message:
+            spawn_background(_delete_quietly(self.message))
+
+
 # --------------------------- إدارة اللاعبين لكل سيرفر ---------------------------
 players: Dict[int, GuildPlayer] = {}
 
@@ -475,87 +1661,1435 @@ def get_player(guild: discord.Guild) -> GuildPlayer:
     return players[guild.id]
 
 
-# --------------------------- يوتيوب DL (async wrapper) ---------------------------
-async def fetch_yt_info(query: str) -> Dict[str, Any]:
-    loop = asyncio.get_running_loop()
-    def _dl():
-        with yt_dlp.YoutubeDL(YTDL_OPTS) as ydl:
-            if is_url(query):
-                return ydl.extract_info(query, download=False)
+players_evicted = 0
+_reaper_task: Optional[asyncio.Task] = None
+_status_task: Optional[asyncio.Task] = None
+_metrics_server: Optional[asyncio.AbstractServer] = None
+
+
+async def evict_player(guild_id: int):
+    global players_evicted
+    player = players.pop(guild_id, None)
+    if player is None:
+        return
+    players_evicted += 1
+    # وقت الإغلاق (ديبلوي) نخلي الحالة عشان ترجع بعد التشغيل
+    if state_store and not bot.is_closed():
+        state_store.forget(guild_id)
+    await player.close()
+
+
+async def reap_idle_players():
+    # يلف كل REAPER_INTERVAL ويفصل/يحذف المشغلات الخاملة أو اللي رومها فاضي
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        now = time.monotonic()
+        for guild_id, player in list(players.items()):
+            try:
+                if player.idle_reason(now):
+                    await evict_player(guild_id)
+            except Exception as e:
+                print(f"⚠️ [{guild_id}] فشل التنظيف: {e!r}")
+
+
+def player_counts() -> Dict[str, int]:
+    return {"live": len(players), "evicted": players_evicted}
+
+
+# --------------------------- حفظ حالة المشغلات (SQLite) ---------------------------
+# write-behind: التغييرات تعلم السيرفر "وسخ" بس، وكل STATE_FLUSH_INTERVAL نكتب الكل بترانزاكشن وحدة
+STATE_DB = os.getenv("STATE_DB")  # فاضي = الحفظ معطل
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+STATE_POSITION_INTERVAL = float(os.getenv("STATE_POSITION_INTERVAL", "15"))  # كل كم نحفظ مكان الأغنية
+STATE_HISTORY_MAX = 20
+STATE_RESTORE_CONCURRENCY = 4
+STATE_TRACK_FIELDS = ("id", "title", "webpage_url", "duration", "thumbnail", "uploader", "view_count")
+
+
+def _compact_track(track: Track) -> Dict[str, Any]:
+    # بدون رابط الستريم (ينتهي)، ونفس مفاتيح yt-dlp عشان Track(info) يرجعه كما هو
+    return {
+        "id": track.video_id,
+        "title": track.title,
+        "webpage_url": track.webpage_url,
+        "duration": track.duration,
+        "thumbnail": track.thumbnail,
+        "uploader": track.uploader,
+        "view_count": track.view_count,
+        "by": track.requested_by.id if track.requested_by else None,
+    }
+
+
+def _restore_track(data: Dict[str, Any], guild: discord.Guild) -> Track:
+    member = guild.get_member(data["by"]) if data.get("by") else None
+    return Track({k: data.get(k) for k in STATE_TRACK_FIELDS}, member)
+
+
+def player_snapshot(player: GuildPlayer) -> Optional[Dict[str, Any]]:
+    # None = ما فيه شي يستاهل نرجعه
+    if not player.vc or not player.vc.is_connected() or (player.current is None and not player.queue):
+        return None
+    return {
+        "voice_channel": player.vc.channel.id,
+        "text_channel": player.text_channel.id if player.text_channel else None,
+        "current": _compact_track(player.current) if player.current else None,
+        "queue": [_compact_track(t) for t in player.queue],
+        "history": [_compact_track(t) for t in islice(reversed(player.history), STATE_HISTORY_MAX)][::-1],
+        "loop_mode": player.loop_mode.name,
+        "volume": player.volume,
+        "autoplay": player.autoplay,
+    }
+
+
+class StateStore:
+    def __init__(self, path: str):
+        self.path = path
+        # guild_id -> True (حالة كاملة) / False (المكان بس)؛ الحذف له مجموعة لحاله
+        self._dirty: Dict[int, bool] = {}
+        self._deleted: set = set()
+        # كل الكتابة من ثريد واحد، فاتصال واحد يكفي
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def mark(self, player: GuildPlayer, full: bool = True):
+        gid = player.guild.id
+        self._deleted.discard(gid)
+        self._dirty[gid] = self._dirty.get(gid, False) or full
+
+    def forget(self, guild_id: int):
+        self._dirty.pop(guild_id, None)
+        self._deleted.add(guild_id)
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS player_state ("
+                " guild_id INTEGER PRIMARY KEY, state TEXT NOT NULL,"
+                " position REAL NOT NULL DEFAULT 0, paused INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)"
+            )
+        return self._db
+
+    def _write(self, full: List[tuple], positions: List[tuple], deleted: List[tuple]):
+        db = self._connect()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO player_state (guild_id, state, position, paused, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(gid, json.dumps(state, separators=(",", ":")), pos, paused, ts)
+                 for gid, state, pos, paused, ts in full],
+            )
+            db.executemany("UPDATE player_state SET position = ?, paused = ?, updated = ? WHERE guild_id = ?",
+                           positions)
+            db.executemany("DELETE FROM player_state WHERE guild_id = ?", deleted)
+
+    def _load(self) -> List[tuple]:
+        return self._connect().execute("SELECT guild_id, state, position, paused FROM player_state").fetchall()
+
+    async def load(self) -> List[tuple]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    async def flush(self):
+        if not self._dirty and not self._deleted:
+            return
+        dirty, self._dirty = self._dirty, {}
+        deleted, self._deleted = self._deleted, set()
+        now = time.time()
+        full, positions = [], []
+        for gid, is_full in dirty.items():
+            player = players.get(gid)
+            if player is None:
+                deleted.add(gid)
+                continue
+            paused = int(bool(player.vc and player.vc.is_paused()))
+            position = player.position() if player.current else 0.0
+            if not is_full:
+                positions.append((position, paused, now, gid))
+                continue
+            # القراءة من الكائنات الحية لازم تكون باللوب؛ json والـ IO بالثريد
+            state = player_snapshot(player)
+            if state is None:
+                deleted.add(gid)
             else:
-                return ydl.extract_info(f"ytsearch1:{query}", download=False)
+                full.append((gid, state, position, paused, now))
+        rows = [(gid,) for gid in deleted]
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write, full, positions, rows)
+        except BaseException:
+            # الكتابة فشلت (قفل/القرص مليان): نرجع العلامات عشان الفلش الجاي يحاول مرة ثانية،
+            # بدون ما نغطي على اللي تغير أثناء الكتابة
+            for gid in deleted:
+                if gid not in self._dirty:
+                    self._deleted.add(gid)
+            for gid, is_full in dirty.items():
+                if gid not in self._deleted:
+                    self._dirty[gid] = self._dirty.get(gid, False) or is_full
+            raise
+        self.flushes += 1
+        self.rows_written += len(full) + len(positions) + len(rows)
+
+    async def run(self):
+        last_positions = time.monotonic()
+        while True:
+            await asyncio.sleep(STATE_FLUSH_INTERVAL)
+            now = time.monotonic()
+            if now - last_positions >= STATE_POSITION_INTERVAL:
+                last_positions = now
+                for player in players.values():
+                    if player.is_playing():
+                        self.mark(player, full=False)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ فشل حفظ حالة المشغلات: {e!r}")
 
-    info = await loop.run_in_executor(None, _dl)
-    if "entries" in info:
-        info = info["entries"][0]
-    return info
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
 
 
-# --------------------------- الأحداث/الأوامر النصية ---------------------------
-PLAY_PATTERNS = [
-    r"^\s*شغل\s+(.+)$",
-    r"^\s*تشغيل\s+(.+)$",
-]
+state_store: Optional[StateStore] = StateStore(STATE_DB) if STATE_DB else None
+_restored = False
 
-@bot.event
-async def on_ready():
-    print(f"✅ Logged in as {bot.user} (ID: {bot.user.id})")
+
+async def _restore_player(guild: discord.Guild, state: Dict[str, Any], position: float, paused: bool):
+    channel = guild.get_channel(state["voice_channel"])
+    # الروم انحذف أو فاضي: ما فيه أحد نرجع له
+    if not isinstance(channel, discord.VoiceChannel) or not any(not m.bot for m in channel.members):
+        state_store.forget(guild.id)
+        return
+    if guild.id in players:
+        return  # أحد شغل شي قبل ما نوصل له
+    player = get_player(guild)
+    text_channel = guild.get_channel(state["text_channel"]) if state.get("text_channel") else None
+    player.text_channel = text_channel if isinstance(text_channel, discord.TextChannel) else None
+    player.loop_mode = LoopMode[state.get("loop_mode", "OFF")]
+    player.volume = state.get("volume", 1.0)
+    player.autoplay = state.get("autoplay", False)
+    for data in state.get("queue", ()):
+        player.queue.append(_restore_track(data, guild))
+    player.history.extend(_restore_track(data, guild) for data in state.get("history", ()))
+    try:
+        player.vc = await channel.connect()
+    except Exception as e:
+        print(f"⚠️ [{guild.id}] تعذر الرجوع للروم: {e!r}")
+        await evict_player(guild.id)
+        return
+    if state.get("current"):
+        # بس الحالية تنحل الحين؛ الطابور ينحل بالتجهيز المسبق قبل دوره
+        player.post(PlayerEvent.RESTORE, _restore_track(state["current"], guild), position, paused)
+    else:
+        player.post(PlayerEvent.PLAY)
 
 
-@bot.event
-async def on_message(message: discord.Message):
-    # تجاهل البوتات
-    if message.author.bot or not message.guild:
+async def restore_sessions():
+    global _restored
+    if state_store is None or _restored:
         return
+    _restored = True
+    try:
+        rows = await state_store.load()
+    except Exception as e:
+        print(f"⚠️ تعذر قراءة حالة المشغلات: {e!r}")
+        return
+    limit = asyncio.Semaphore(STATE_RESTORE_CONCURRENCY)
+
+    async def restore(guild: discord.Guild, state: Dict[str, Any], position: float, paused: bool):
+        async with limit:
+            try:
+                await _restore_player(guild, state, position, paused)
+            except Exception as e:
+                print(f"⚠️ [{guild.id}] فشل استرجاع الجلسة: {e!r}")
+
+    jobs = []
+    for guild_id, raw, position, paused in rows:
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            continue  # سيرفر على شارد/عملية ثانية
+        jobs.append(restore(guild, json.loads(raw), position, bool(paused)))
+    if jobs:
+        print(f"♻️ restoring {len(jobs)} sessions")
+        await asyncio.gather(*jobs)
+
+
+# --------------------------- كاش نتائج يوتيوب ---------------------------
+# كاش مشترك بين كل السيرفرات: الميتاداتا تعيش طويلًا، ورابط الستريم ينتهي مع باراميتر expire
+RESOLVE_CACHE_MAX_BYTES = int(os.getenv("RESOLVE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+RESOLVE_ALIAS_MAX = 4096  # أقصى عدد بحوث/روابط محفوظة تشير لنفس المقطع
+META_TTL = 6 * 3600  # ثواني
+STREAM_FALLBACK_TTL = 30 * 60  # لو الرابط ما فيه expire
+STREAM_EXPIRY_MARGIN = 60  # نعتبر الرابط منتهي قبل وقته بدقيقة
+
+# الحقول الوحيدة اللي نحتاجها من نتيجة yt-dlp (الباقي فورمات وهيدرز تاخذ ذاكرة عالفاضي)
+META_FIELDS = ("id", "title", "webpage_url", "duration", "thumbnail", "uploader", "view_count", "acodec", "ext")
+
+_YT_ID_RE = re.compile(r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([\w-]{11})")
+_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+def normalize_query(q: str) -> str:
+    q = q.strip()
+    if is_url(q):
+        m = _YT_ID_RE.search(q)
+        if m:
+            return f"yt:{m.group(1)}"
+        return q
+    # نفس البحث بحروف/مسافات مختلفة = نفس المفتاح
+    return "q:" + " ".join(q.casefold().split())
 
-    content = message.content.strip()
 
-    query = None
-    for pat in PLAY_PATTERNS:
-        m = re.match(pat, content, flags=re.IGNORECASE)
+def stream_expiry(url: Optional[str]) -> float:
+    # روابط googlevideo فيها expire بوقت يونكس، إما كباراميتر أو داخل المسار
+    if url:
+        m = _EXPIRE_RE.search(url)
         if m:
-            query = m.group(1).strip()
+            return float(m.group(1)) - STREAM_EXPIRY_MARGIN
+    return time.time() + STREAM_FALLBACK_TTL
+
+
+class _CacheEntry:
+    __slots__ = ("meta", "stream_url", "stream_expires", "meta_expires", "size")
+
+    def __init__(self, meta: Dict[str, Any], stream_url: Optional[str]):
+        self.meta = meta
+        self.stream_url = stream_url
+        self.stream_expires = stream_expiry(stream_url)
+        self.meta_expires = time.time() + META_TTL
+        # تقدير تقريبي للحجم، يكفي للـ LRU
+        self.size = 256 + len(stream_url or "") + sum(len(str(v)) + 64 for v in meta.values())
+
+
+class ResolveCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()  # مفتاح المقطع -> بيانات
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()  # بحث/رابط -> مفتاح المقطع
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # طلبات انتظرت استخراج شغال بدل ما تبدأ واحد جديد
+
+    def _entry(self, key: str) -> Optional[_CacheEntry]:
+        entry_key = self._aliases.get(key, key)
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        if entry.meta_expires <= time.time():
+            self._drop(entry_key)
+            return None
+        self._entries.move_to_end(entry_key)
+        if key in self._aliases:
+            self._aliases.move_to_end(key)
+        return entry
+
+    def _drop(self, entry_key: str):
+        entry = self._entries.pop(entry_key, None)
+        if entry:
+            self._bytes -= entry.size
+
+    def lookup(self, key: str, fresh_for: float = 0.0) -> Optional[Dict[str, Any]]:
+        # fresh_for: الرابط لازم يبقى صالح كذا ثانية (طول اللي باقي من الأغنية)
+        entry = self._entry(key)
+        if entry is None or not entry.stream_url or entry.stream_expires <= time.time() + fresh_for:
+            return None
+        return {**entry.meta, "url": entry.stream_url}
+
+    def invalidate(self, key: str):
+        # الرابط فشل فعليًا (403/انقطاع)؛ الميتاداتا تبقى والاستخراج الجاي يكون من رابط المقطع
+        entry = self._entry(key)
+        if entry is not None:
+            entry.stream_url = None
+            entry.stream_expires = 0.0
+
+    def stale_target(self, key: str) -> Optional[str]:
+        # الميتاداتا موجودة بس الرابط انتهى: نعيد الاستخراج من رابط المقطع مباشرة بدل البحث
+        entry = self._entry(key)
+        return entry.meta.get("webpage_url") if entry else None
+
+    def store(self, key: str, info: Dict[str, Any]) -> Dict[str, Any]:
+        meta = {k: info[k] for k in META_FIELDS if info.get(k) is not None}
+        entry_key = f"yt:{meta['id']}" if meta.get("id") else key
+        self._drop(entry_key)
+        entry = _CacheEntry(meta, info.get("url"))
+        self._entries[entry_key] = entry
+        self._bytes += entry.size
+        if key != entry_key:
+            self._aliases[key] = entry_key
+            self._aliases.move_to_end(key)
+            while len(self._aliases) > RESOLVE_ALIAS_MAX:
+                self._aliases.popitem(last=False)
+        # LRU: أقدم شي يطلع أول
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+        return {**meta, "url": entry.stream_url}
+
+    async def resolve(self, query: str, extract: Callable[[str], Awaitable[Dict[str, Any]]],
+                      fresh_for: float = 0.0) -> Dict[str, Any]:
+        key = normalize_query(query)
+        info = self.lookup(key, fresh_for)
+        if info is not None:
+            self.hits += 1
+            RESOLVE_CACHE_LOOKUPS.inc("hit")
+            return info
+
+        # single-flight: نفس الطلب شغال؟ انتظر نتيجته
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            RESOLVE_CACHE_LOOKUPS.inc("shared")
+        else:
+            self.misses += 1
+            RESOLVE_CACHE_LOOKUPS.inc("miss")
+            # الاستخراج تاسك لحاله: إلغاء أي منتظر (حتى اللي بداه) ما يلغيه على الباقين
+            task = asyncio.ensure_future(self._fetch(key, query, extract))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(_inflight_done, self._inflight, key))
+        return dict(await asyncio.shield(task))
+
+    async def _fetch(self, key: str, query: str, extract: Callable[[str], Awaitable[Dict[str, Any]]]):
+        return self.store(key, await extract(self.stale_target(key) or query))
+
+
+def _inflight_done(inflight: Dict[str, asyncio.Future], key: str, task: asyncio.Future):
+    if inflight.get(key) is task:
+        del inflight[key]
+    if not task.cancelled():
+        task.exception()  # حتى ما يطلع تحذير لو كل المنتظرين انلغوا
+
+
+resolve_cache = ResolveCache(RESOLVE_CACHE_MAX_BYTES)
+
+
+# --------------------------- كاش الصوت على الديسك ---------------------------
+# الأغاني اللي تتكرر تنحفظ بصيغتها الأصلية (webm/opus) وتشتغل من الملف بدل يوتيوب
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR")  # فاضي = الكاش معطل
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "2"))  # كم مرة تنطلب قبل ما نحفظها
+AUDIO_CACHE_MAX_FILE = 64 * 1024 * 1024
+AUDIO_CACHE_MAX_DURATION = 20 * 60  # ثواني
+AUDIO_CACHE_DOWNLOADS = 2  # تحميلات متزامنة
+AUDIO_CACHE_CHUNK = 10 * 1024 * 1024  # googlevideo يبطئ الطلبات الطويلة، فنحمل بقطع Range
+
+
+def _download_stream(url: str, dest: str, max_bytes: int) -> int:
+    # يحمل لملف .part ويتأكد إن الحجم يطابق المعلن قبل ما يسميه باسمه النهائي
+    part = dest + ".part"
+    pos = 0
+    total: Optional[int] = None
+    try:
+        with open(part, "wb") as f:
+            while total is None or pos < total:
+                req = urllib.request.Request(url, headers={
+                    "User-Agent": "Mozilla/5.0",
+                    "Range": f"bytes={pos}-{pos + AUDIO_CACHE_CHUNK - 1}",
+                })
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    if resp.status == 200:
+                        # السيرفر تجاهل الـ Range وأرسل الملف كامل
+                        length = resp.headers.get("Content-Length")
+                        total = int(length) if length else None
+                    else:
+                        content_range = resp.headers.get("Content-Range", "")  # bytes 0-99/1234
+                        size = content_range.rpartition("/")[2]
+                        total = int(size) if size.isdigit() else None
+                    got = 0
+                    while True:
+                        chunk = resp.read(256 * 1024)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        got += len(chunk)
+                        pos += len(chunk)
+                        if pos > max_bytes:
+                            raise IOError("الملف أكبر من الحد المسموح")
+                    if resp.status == 200 or total is None:
+                        break
+                    if not got:
+                        raise IOError("رد فاضي في نص التحميل")
+        if not pos or (total is not None and pos != total):
+            raise IOError(f"تحميل ناقص ({pos}/{total})")
+        os.replace(part, dest)
+        return pos
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+
+
+class AudioDiskCache:
+    def __init__(self, directory: str, max_bytes: int, min_plays: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        os.makedirs(directory, exist_ok=True)
+
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # video id -> حجم، مرتبة LRU
+        self._bytes = 0
+        self._plays: "OrderedDict[str, int]" = OrderedDict()  # عداد الطلبات للأغاني اللي ما انحفظت
+        self._downloading: set = set()
+        self._tasks: set = set()
+        self._executor: Optional[Executor] = None
+
+        self.hits = 0
+        self.downloads = 0
+        self.failed = 0
+        self.evicted = 0
+
+        # الملفات الموجودة من تشغيل سابق؛ أي .part يعني تحميل انقطع
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+            elif name.endswith(".webm"):
+                st = os.stat(path)
+                found.append((st.st_mtime, name[:-5], st.st_size))
+        for _, video_id, size in sorted(found):
+            self._files[video_id] = size
+            self._bytes += size
+        self._evict()
+
+    def _path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.webm")
+
+    def _forget(self, video_id: str):
+        size = self._files.pop(video_id, None)
+        if size is not None:
+            self._bytes -= size
+        try:
+            os.remove(self._path(video_id))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._files:
+            video_id = next(iter(self._files))
+            self._forget(video_id)
+            self.evicted += 1
+
+    def contains(self, video_id: Optional[str]) -> bool:
+        return bool(video_id) and video_id in self._files
+
+    def _valid_path(self, video_id: Optional[str]) -> Optional[str]:
+        if not self.contains(video_id):
+            return None
+        path = self._path(video_id)
+        try:
+            complete = os.path.getsize(path) == self._files[video_id]
+        except OSError:
+            complete = False
+        if not complete:
+            # الملف انحذف أو انقص من برا
+            self._forget(video_id)
+            return None
+        return path
+
+    def has_file(self, video_id: Optional[str]) -> bool:
+        # مثل contains بس يتأكد إن الملف سليم، عشان ما نتخطى تجديد الرابط على ملف بايظ
+        return self._valid_path(video_id) is not None
+
+    def path_for(self, video_id: Optional[str]) -> Optional[str]:
+        path = self._valid_path(video_id)
+        if path is None:
+            return None
+        self._files.move_to_end(video_id)
+        self.hits += 1
+        return path
+
+    def note_play(self, track: Track):
+        video_id = track.video_id
+        if not video_id or video_id in self._files or video_id in self._downloading:
+            return
+        plays = self._plays.pop(video_id, 0) + 1
+        self._plays[video_id] = plays
+        while len(self._plays) > 10000:
+            self._plays.popitem(last=False)
+        if plays < self.min_plays or track.acodec != "opus" or not track.is_fresh():
+            return
+        if track.duration and track.duration > AUDIO_CACHE_MAX_DURATION:
+            return
+        self._downloading.add(video_id)
+        task = asyncio.create_task(self._download(video_id, track.stream_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _download(self, video_id: str, url: str):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=AUDIO_CACHE_DOWNLOADS, thread_name_prefix="audio-cache")
+        loop = asyncio.get_running_loop()
+        try:
+            size = await loop.run_in_executor(
+                self._executor, _download_stream, url, self._path(video_id), AUDIO_CACHE_MAX_FILE
+            )
+        except Exception:
+            self.failed += 1
+            return
+        finally:
+            self._downloading.discard(video_id)
+        self._plays.pop(video_id, None)
+        self._files[video_id] = size
+        self._bytes += size
+        self.downloads += 1
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "files": len(self._files),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "downloads": self.downloads,
+            "downloading": len(self._downloading),
+            "failed": self.failed,
+            "evicted": self.evicted,
+        }
+
+
+audio_cache: Optional[AudioDiskCache] = (
+    AudioDiskCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_MIN_PLAYS) if AUDIO_CACHE_DIR else None
+)
+
+
+# --------------------------- مسبح الاستخراج ---------------------------
+# مسبح خاص بـ yt-dlp بدل الـ executor الافتراضي حق اللوب، مع دور عادل بين السيرفرات
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "thread")  # thread | process
+EXTRACT_QUEUE_MAX = int(os.getenv("EXTRACT_QUEUE_MAX", "64"))  # كل الطلبات المنتظرة
+EXTRACT_QUEUE_PER_GUILD = int(os.getenv("EXTRACT_QUEUE_PER_GUILD", "8"))
+
+YTDL_PROFILES = {
+    "full": YTDL_OPTS,
+    "flat": YTDL_FLAT_OPTS,
+}
+
+# كل ووركر يحتفظ بـ YoutubeDL جاهز لكل بروفايل بدل ما ينشئ واحد كل طلب
+_ydl_local = threading.local()
+
+
+def _get_ydl(profile: str) -> yt_dlp.YoutubeDL:
+    ydls = getattr(_ydl_local, "ydls", None)
+    if ydls is None:
+        ydls = _ydl_local.ydls = {}
+    ydl = ydls.get(profile)
+    if ydl is None:
+        ydl = ydls[profile] = yt_dlp.YoutubeDL(YTDL_PROFILES[profile])
+    return ydl
+
+
+def slim_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    slim = {k: info[k] for k in META_FIELDS if info.get(k) is not None}
+    slim["url"] = info.get("url")
+    return slim
+
+
+def _extract_job(profile: str, target: str) -> Dict[str, Any]:
+    # يشتغل داخل الووركر (ثريد أو بروسس)؛ نرجع النسخة المختصرة عشان ما ننقل فورمات ما نحتاجها
+    info = _get_ydl(profile).extract_info(target, download=False)
+    if "entries" in info:
+        info = info["entries"][0]
+    return slim_info(info)
+
+
+def _search_job(query: str, count: int) -> List[Dict[str, Any]]:
+    # بحث سطحي: عناوين ومدد بدون فورمات، والمختارة بس تنحل كاملة وقت تشغيلها
+    info = _get_ydl("flat").extract_info(f"ytsearch{count}:{query}", download=False)
+    return [_flat_entry(e) for e in islice(info.get("entries") or [], count) if e and e.get("id")]
+
+
+def _flat_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # عنصر قائمة من الاستخراج السطحي: بدون رابط ستريم
+    vid = entry.get("id")
+    url = entry.get("url")
+    thumbs = entry.get("thumbnails") or []
+    duration = entry.get("duration")
+    return {
+        "id": vid,
+        "title": entry.get("title") or "بدون عنوان",
+        "webpage_url": url if url and is_url(url) else f"https://www.youtube.com/watch?v={vid}",
+        # نتايج البحث السطحي أحيانًا ترجع المدة float، والبانل يبيها ثواني صحيحة
+        "duration": int(duration) if duration else None,
+        "uploader": entry.get("uploader") or entry.get("channel"),
+        "view_count": entry.get("view_count"),
+        "thumbnail": thumbs[-1].get("url") if thumbs else None,
+    }
+
+
+def _stream_playlist_job(target: str, limit: int, emit: Callable[[Dict[str, Any]], Any],
+                         stop: threading.Event) -> int:
+    # process=False يرجع entries كـ generator، فنرسل كل عنصر للوب أول ما توصل صفحته
+    ydl = _get_ydl("flat")
+    info = ydl.extract_info(target, download=False, process=False)
+    for _ in range(3):
+        if info.get("_type") not in ("url", "url_transparent"):
+            break
+        info = ydl.extract_info(info["url"], ie_key=info.get("ie_key"), download=False, process=False)
+    count = 0
+    for entry in info.get("entries") or []:
+        if count >= limit or stop.is_set():
             break
+        if not entry or not entry.get("id"):
+            continue
+        emit(_flat_entry(entry))
+        count += 1
+    return count
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ExtractionBusy(RuntimeError):
+    pass
+
+
+class _ExtractJob:
+    __slots__ = ("fn", "args", "in_thread", "future", "enqueued")
+
+    def __init__(self, fn: Callable, args: tuple, in_thread: bool, future: asyncio.Future, enqueued: float):
+        self.fn = fn
+        self.args = args
+        self.in_thread = in_thread
+        self.future = future
+        self.enqueued = enqueued
+
+
+class ExtractionPool:
+    def __init__(self, workers: int, mode: str, max_pending: int, max_pending_per_guild: int):
+        self.workers = max(1, workers)
+        self.mode = mode
+        self.max_pending = max_pending
+        self.max_pending_per_guild = max_pending_per_guild
+
+        self._executor: Optional[Executor] = None
+        self._thread_executor: Optional[Executor] = None  # للمهام اللي لازم ثريد حتى بوضع process
+        # طابور لكل سيرفر، والدور يلف عليهم (round-robin)
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._pending = 0
+        self._running = 0
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_times: deque = deque(maxlen=512)  # ثواني في الطابور
+        self._run_times: deque = deque(maxlen=512)  # ثواني استخراج
+
+    def _get_executor(self, in_thread: bool = False) -> Executor:
+        if in_thread and self.mode == "process":
+            if self._thread_executor is None:
+                self._thread_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ytdl-flat")
+            return self._thread_executor
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ytdl")
+        return self._executor
+
+    async def submit(self, guild_id: int, profile: str, target: str, playback: bool = False) -> Dict[str, Any]:
+        return await self.run(guild_id, _extract_job, profile, target, playback=playback)
+
+    async def run(self, guild_id: int, fn: Callable, *args, in_thread: bool = False, playback: bool = False):
+        # playback: المشغل نفسه يجدد رابط أغنية بالطابور؛ ما ينرفض ويتقدم على طلبات السيرفر
+        q = self._queues.get(guild_id)
+        if not playback and (self._pending >= self.max_pending
+                             or (q is not None and len(q) >= self.max_pending_per_guild)):
+            # backpressure: نرفض بدل ما نكدس طلبات ما راح تخلص
+            self.rejected += 1
+            EXTRACT_RESULTS.inc("rejected")
+            raise ExtractionBusy("الطلبات كثيرة حاليًا، جرّب بعد شوي.")
+        loop = asyncio.get_running_loop()
+        job = _ExtractJob(fn, args, in_thread, loop.create_future(), loop.time())
+        if q is None:
+            q = self._queues[guild_id] = deque()
+        if playback:
+            q.appendleft(job)
+        else:
+            q.append(job)
+        self._pending += 1
+        self._pump()
+        return await job.future
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers and self._queues:
+            guild_id, q = next(iter(self._queues.items()))
+            job = q.popleft()
+            # السيرفر يرجع لآخر الدور حتى لو عنده طلبات ثانية
+            if q:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            self._pending -= 1
+            if job.future.done():
+                # صاحب الطلب لغاه وهو ينتظر
+                continue
+            self._running += 1
+            started = loop.time()
+            self._wait_times.append(started - job.enqueued)
+            EXTRACT_WAIT_SECONDS.observe(started - job.enqueued)
+            fut = loop.run_in_executor(self._get_executor(job.in_thread), job.fn, *job.args)
+            fut.add_done_callback(functools.partial(self._finished, job, started))
+
+    def _finished(self, job: _ExtractJob, started: float, fut: asyncio.Future):
+        self._running -= 1
+        elapsed = asyncio.get_running_loop().time() - started
+        self._run_times.append(elapsed)
+        EXTRACT_RUN_SECONDS.observe(elapsed)
+        if fut.cancelled():
+            job.future.cancel()
+        elif fut.exception() is not None:
+            self.failed += 1
+            EXTRACT_RESULTS.inc("failed")
+            if not job.future.done():
+                job.future.set_exception(fut.exception())
+        else:
+            self.completed += 1
+            EXTRACT_RESULTS.inc("completed")
+            if not job.future.done():
+                job.future.set_result(fut.result())
+        self._pump()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "running": self._running,
+            "pending": self._pending,
+            "guilds_waiting": len(self._queues),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_wait_p50": _percentile(self._wait_times, 50),
+            "queue_wait_p95": _percentile(self._wait_times, 95),
+            "extract_p50": _percentile(self._run_times, 50),
+            "extract_p95": _percentile(self._run_times, 95),
+        }
+
+
+extraction_pool = ExtractionPool(EXTRACT_WORKERS, EXTRACT_MODE, EXTRACT_QUEUE_MAX, EXTRACT_QUEUE_PER_GUILD)
+
+
+# --------------------------- يوتيوب DL (async wrapper) ---------------------------
+async def _extract_info(query: str, guild_id: int = 0, playback: bool = False) -> Dict[str, Any]:
+    target = query if is_url(query) else f"ytsearch1:{query}"
+    return await extraction_pool.submit(guild_id, "full", target, playback=playback)
+
+
+async def fetch_yt_info(query: str, guild_id: int = 0, fresh_for: float = 0.0,
+                        playback: bool = False) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        extract = functools.partial(_extract_info, guild_id=guild_id, playback=playback)
+        return await resolve_cache.resolve(query, extract, fresh_for)
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - started, guild_bucket(guild_id))
+
+
+SEARCH_RESULTS = 5
+SEARCH_TTL = 30 * 60  # ثواني؛ نتايج البحث تتغير ببطء
+SEARCH_CACHE_MAX = 512  # عدد البحوث المحفوظة
+SEARCH_CACHE_LOOKUPS = Counter("bot_search_cache_total", "search result list cache lookups", ("result",))
+
+
+class SearchCache:
+    # قايمة النتايج لكل بحث موحد (بدون روابط ستريم، فما تنتهي مع الرابط)
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # مفتاح -> (ينتهي، النتايج)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def search(self, query: str, guild_id: int = 0) -> List[Dict[str, Any]]:
+        key = normalize_query(query)
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] > time.time():
+            self._entries.move_to_end(key)
+            SEARCH_CACHE_LOOKUPS.inc("hit")
+            return cached[1]
+        task = self._inflight.get(key)
+        if task is not None:
+            SEARCH_CACHE_LOOKUPS.inc("shared")
+        else:
+            SEARCH_CACHE_LOOKUPS.inc("miss")
+            # نفس ResolveCache: البحث تاسك لحاله وكل المنتظرين عليه shield
+            task = asyncio.ensure_future(self._fetch(key, query, guild_id))
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(_inflight_done, self._inflight, key))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, query: str, guild_id: int) -> List[Dict[str, Any]]:
+        results = await extraction_pool.run(guild_id, _search_job, query, SEARCH_RESULTS)
+        self._entries[key] = (time.time() + SEARCH_TTL, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return results
+
+
+search_cache = SearchCache(SEARCH_CACHE_MAX)
+
+
+async def iter_playlist(url: str, guild_id: int = 0, limit: int = PLAYLIST_MAX_ENTRIES, playback: bool = False):
+    # يرجع عناصر القائمة (بدون روابط ستريم) أول بأول وهي تنجلب
+    loop = asyncio.get_running_loop()
+    entries: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    emit = functools.partial(loop.call_soon_threadsafe, entries.put_nowait)
+    job = asyncio.ensure_future(
+        extraction_pool.run(guild_id, _stream_playlist_job, url, limit, emit, stop, in_thread=True, playback=playback)
+    )
+    # تنحط بعد كل العناصر لأن الثريد يرسلها قبل ما يخلص
+    job.add_done_callback(lambda _: entries.put_nowait(None))
+    try:
+        while True:
+            entry = await entries.get()
+            if entry is None:
+                break
+            yield entry
+        await job  # يرفع الخطأ لو الاستخراج فشل
+    finally:
+        stop.set()
+        if not job.done():
+            job.cancel()
+
+
+async def enqueue_playlist(player: "GuildPlayer", url: str, member: discord.Member,
+                           text_channel: discord.TextChannel):
+    # كل أغنية تنضاف أول ما توصل؛ الأولى تبدأ تشتغل والباقي ينحل قبل دوره
+    count = 0
+    try:
+        async for entry in iter_playlist(url, player.guild.id):
+            await player.enqueue_and_maybe_play(Track(entry, member), text_channel)
+            count += 1
+    except Exception as e:
+        await text_channel.send(f"تعذر جلب قائمة التشغيل: `{e}`")
+    if count:
+        await text_channel.send(f"تمت إضافة {count} أغنية للطابور.", delete_after=10)
+
+
+# --------------------------- البروفايلنج عند الطلب ---------------------------
+# يشتغل وقت ما نبي بدون ريستارت (الريستارت يقطع كل الرومات الصوتية):
+# أمر "بروفايل [ثواني]" لصاحب البوت، أو kill -USR1 <pid>. نفس الأمر مرة ثانية يوقفه بدري
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_MAX_SECONDS = 300.0
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10")) / 1000
+PROFILE_TRACE_FRAMES = 16  # عمق tracebacks في tracemalloc
+PROFILE_TOP = 40
+
+
+class _CodeIndex:
+    # يربط كود البوت بالجزء اللي يخصه: GuildPlayer / ControlView / extraction
+    def __init__(self, targets: Dict[str, list]):
+        self.by_code: Dict[Any, tuple] = {}
+        self.by_key: Dict[tuple, tuple] = {}  # (file, line, name) مثل مفاتيح pstats
+        self._ranges: Dict[str, List[tuple]] = {}
+        for component, objs in targets.items():
+            for obj in objs:
+                funcs = vars(obj).values() if isinstance(obj, type) else (obj,)
+                for f in funcs:
+                    if isinstance(f, (staticmethod, classmethod)):
+                        f = f.__func__
+                    elif isinstance(f, property):
+                        f = f.fget
+                    code = getattr(f, "__code__", None)
+                    if code is not None:
+                        self._add(code, component)
+        for ranges in self._ranges.values():
+            ranges.sort()
+
+    def _add(self, code, component: str):
+        qualname = getattr(code, "co_qualname", code.co_name)
+        entry = (qualname, component)
+        self.by_code[code] = entry
+        self.by_key[(code.co_filename, code.co_firstlineno, code.co_name)] = entry
+        lines = [line for _, _, line in code.co_lines() if line]
+        end = max(lines) if lines else code.co_firstlineno
+        self._ranges.setdefault(code.co_filename, []).append((code.co_firstlineno, end, entry))
+        # الدوال الداخلية واللامبدا جوا الميثود (كولباكات الصوت مثلًا)
+        for const in code.co_consts:
+            if hasattr(const, "co_code"):
+                self._add(const, component)
+
+    def at(self, filename: str, lineno: int) -> Optional[tuple]:
+        # أعمق دالة تغطي السطر
+        best = None
+        for start, end, entry in self._ranges.get(filename, ()):
+            if start > lineno:
+                break
+            if lineno <= end:
+                best = entry
+        return best
+
+
+def _profile_index() -> _CodeIndex:
+    return _CodeIndex({
+        "GuildPlayer": [GuildPlayer],
+        "ControlView": [ControlView],
+        "extraction": [ExtractionPool, ResolveCache, _get_ydl, slim_info, _extract_job, _flat_entry,
+                       _stream_playlist_job, _extract_info, fetch_yt_info, iter_playlist, enqueue_playlist],
+    })
+
+
+def _frame_label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    # يسحب ستاك كل الثريدات كل interval (يشوف ثريدات الاستخراج اللي cProfile ما يشوفها)
+    def __init__(self, interval: float, index: _CodeIndex):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.index = index
+        self.samples = 0
+        self.stacks: Dict[str, int] = {}
+        self.by_component: Dict[str, int] = {}
+        self.by_function: Dict[str, int] = {}
+        self._halt = threading.Event()
+        self._names: Dict[int, str] = {}
+
+    def halt(self):
+        self._halt.set()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._halt.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in self._names:
+                    self._names = {t.ident: t.name for t in threading.enumerate()}
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                name = self._names.get(ident, str(ident)).replace(";", ":").replace(" ", "_")
+                stack = ";".join([name] + [_frame_label(c) for c in codes])
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                # شامل: الستاك يحسب مرة وحدة لكل جزء/دالة فيه
+                seen = {self.index.by_code[c] for c in codes if c in self.index.by_code}
+                for qualname, component in seen:
+                    self.by_function[qualname] = self.by_function.get(qualname, 0) + 1
+                for component in {component for _, component in seen}:
+                    self.by_component[component] = self.by_component.get(component, 0) + 1
+
+
+class ProfileSession:
+    def __init__(self, seconds: float, reason: str, channel: Optional[discord.abc.Messageable] = None):
+        self.seconds = max(1.0, min(seconds, PROFILE_MAX_SECONDS))
+        self.reason = reason
+        self.channel = channel
+        self.base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        self.index = _profile_index()
+        self._cpu = cProfile.Profile()
+        self._sampler = _StackSampler(PROFILE_SAMPLE_INTERVAL, self.index)
+        self._own_tracemalloc = False
+        self._before: Optional[tracemalloc.Snapshot] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._started = 0.0
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACE_FRAMES)
+            self._own_tracemalloc = True
+        self._before = tracemalloc.take_snapshot()
+        self._sampler.start()
+        self._started = time.perf_counter()
+        # cProfile يغطي ثريد اللوب: الإيفنتات، handlers الأزرار، والكوروتينات
+        self._cpu.enable()
+        self._timer = asyncio.get_running_loop().call_later(self.seconds, self._expire)
+
+    def _expire(self):
+        if profile_session is self:
+            spawn_background(stop_profiling())
+
+    async def stop(self) -> List[str]:
+        self._cpu.disable()
+        elapsed = time.perf_counter() - self._started
+        if self._timer:
+            self._timer.cancel()
+        self._sampler.halt()
+        after = tracemalloc.take_snapshot()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        # الكتابة والتحليل بعيد عن اللوب
+        return await asyncio.get_running_loop().run_in_executor(None, self._write, after, elapsed)
+
+    def _write(self, after: tracemalloc.Snapshot, elapsed: float) -> List[str]:
+        self._sampler.join()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        paths = {
+            "pstats": self.base + ".prof",
+            "collapsed": self.base + ".collapsed.txt",
+            "before": self.base + ".before.tracemalloc",
+            "after": self.base + ".after.tracemalloc",
+            "diff": self.base + ".tracemalloc-diff.txt",
+            "summary": self.base + ".summary.txt",
+        }
+        self._cpu.dump_stats(paths["pstats"])
+        with open(paths["collapsed"], "w", encoding="utf-8") as f:
+            for stack, count in sorted(self._sampler.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        self._before.dump(paths["before"])
+        after.dump(paths["after"])
+        diff = after.compare_to(self._before, "traceback")
+        with open(paths["diff"], "w", encoding="utf-8") as f:
+            for stat in diff[:PROFILE_TOP]:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format(most_recent_first=True):
+                    f.write(f"    {line}\n")
+        with open(paths["summary"], "w", encoding="utf-8") as f:
+            f.write("\n".join(self._summary(diff, elapsed)) + "\n")
+        return list(paths.values())
+
+    def _summary(self, diff: List[tracemalloc.StatisticDiff], elapsed: float) -> List[str]:
+        lines = [f"profile {os.path.basename(self.base)} reason={self.reason} window={elapsed:.1f}s", ""]
+
+        # cProfile: tottime بالجزء (ما يتكرر)، وأعلى الدوال بالـ cumtime
+        cpu_component: Dict[str, List[float]] = {}
+        cpu_function = []
+        for key, (_, ncalls, tottime, cumtime, _) in pstats.Stats(self._cpu).stats.items():
+            entry = self.index.by_key.get(key)
+            if entry is None:
+                continue
+            qualname, component = entry
+            totals = cpu_component.setdefault(component, [0, 0.0])
+            totals[0] += ncalls
+            totals[1] += tottime
+            cpu_function.append((cumtime, tottime, ncalls, qualname))
+        lines.append("== cpu (cProfile, event loop thread)")
+        lines.append(f"{'component':<14}{'calls':>10}{'tottime_s':>12}")
+        for component, (calls, tottime) in sorted(cpu_component.items(), key=lambda kv: -kv[1][1]):
+            lines.append(f"{component:<14}{calls:>10}{tottime:>12.4f}")
+        lines.append("")
+        lines.append(f"{'cumtime_s':>10}{'tottime_s':>11}{'calls':>9}  function")
+        for cumtime, tottime, ncalls, qualname in sorted(cpu_function, reverse=True)[:PROFILE_TOP]:
+            lines.append(f"{cumtime:>10.4f}{tottime:>11.4f}{ncalls:>9}  {qualname}")
+        lines.append("")
+
+        sampler = self._sampler
+        lines.append(f"== sampling (all threads, {sampler.samples} ticks @ {sampler.interval * 1000:.0f}ms, inclusive)")
+        for component, count in sorted(sampler.by_component.items(), key=lambda kv: -kv[1]):
+            lines.append(f"{component:<14}{count:>8}  {100 * count / max(1, sampler.samples):6.1f}%")
+        for qualname, count in sorted(sampler.by_function.items(), key=lambda kv: -kv[1])[:PROFILE_TOP]:
+            lines.append(f"{count:>8}  {qualname}")
+        lines.append("")
+
+        # الذاكرة: كل فرق ينحسب لأقرب دالة من كودنا في الـ traceback
+        mem_component: Dict[str, int] = {}
+        mem_function: Dict[str, int] = {}
+        for stat in diff:
+            for frame in reversed(stat.traceback):
+                entry = self.index.at(frame.filename, frame.lineno)
+                if entry is not None:
+                    mem_function[entry[0]] = mem_function.get(entry[0], 0) + stat.size_diff
+                    mem_component[entry[1]] = mem_component.get(entry[1], 0) + stat.size_diff
+                    break
+        lines.append("== memory growth (tracemalloc diff)")
+        lines.append(f"{'total':<14}{sum(stat.size_diff for stat in diff):>+12} B")
+        for component, size in sorted(mem_component.items(), key=lambda kv: -abs(kv[1])):
+            lines.append(f"{component:<14}{size:>+12} B")
+        for qualname, size in sorted(mem_function.items(), key=lambda kv: -abs(kv[1]))[:PROFILE_TOP]:
+            lines.append(f"{size:>+12} B  {qualname}")
+        return lines
+
+
+profile_session: Optional[ProfileSession] = None
+
+
+def start_profiling(seconds: float, reason: str,
+                    channel: Optional[discord.abc.Messageable] = None) -> ProfileSession:
+    global profile_session
+    profile_session = ProfileSession(seconds, reason, channel)
+    profile_session.start()
+    print(f"🔬 profiling for {profile_session.seconds:.0f}s ({reason}) -> {profile_session.base}.*")
+    return profile_session
+
+
+async def stop_profiling() -> Optional[List[str]]:
+    global profile_session
+    session, profile_session = profile_session, None
+    if session is None:
+        return None
+    try:
+        paths = await session.stop()
+    except Exception as e:
+        print(f"⚠️ فشل حفظ البروفايل: {e!r}")
+        return None
+    print(f"🔬 profile saved: {session.base}.*")
+    if session.channel is not None:
+        try:
+            files = "\n".join(f"`{p}`" for p in paths)
+            await session.channel.send(f"🔬 خلص البروفايل:\n{files}")
+        except Exception:
+            pass
+    return paths
+
+
+def toggle_profiling(seconds: float = PROFILE_SECONDS, reason: str = "signal",
+                     channel: Optional[discord.abc.Messageable] = None):
+    if profile_session is not None:
+        spawn_background(stop_profiling())
+    else:
+        start_profiling(seconds, reason, channel)
 
-    if query is None:
-        return  # مش أمر تشغيل
 
-    # حاول حذف رسالة المستخدم
+def install_profile_signal():
+    # على ويندوز ما فيه SIGUSR1 ولا add_signal_handler
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiling)
+    except (AttributeError, NotImplementedError, RuntimeError):
+        pass
+
+
+# --------------------------- حماية من السبام ---------------------------
+# token bucket لكل عضو ولكل سيرفر قبل أي استخراج، وطلبات نفس الأغنية المتكررة تندمج
+RATE_USER_BURST = float(os.getenv("RATE_USER_BURST", "3"))
+RATE_USER_PER_MINUTE = float(os.getenv("RATE_USER_PER_MINUTE", "12"))
+RATE_GUILD_BURST = float(os.getenv("RATE_GUILD_BURST", "10"))
+RATE_GUILD_PER_MINUTE = float(os.getenv("RATE_GUILD_PER_MINUTE", "60"))
+PLAY_COALESCE_WINDOW = float(os.getenv("PLAY_COALESCE_WINDOW", "15"))  # ثواني
+RATE_NOTICE_INTERVAL = 10.0  # تنبيه وحد لكل عضو مهما سبّم
+NOTICE_MAX_INFLIGHT = 64  # فوقها التنبيهات تنرمى بدل ما تتكدس
+NOTICE_SECONDS = 4
+
+
+class RateLimiter:
+    # الباكت: [توكنز، آخر تحديث]؛ الممتلي ينشال عشان القاموس ما يكبر للأبد
+    def __init__(self, burst: float, per_minute: float):
+        self.capacity = burst
+        self.rate = per_minute / 60.0
+        self._buckets: Dict[int, List[float]] = {}
+        self._calls = 0
+
+    def _bucket(self, key: int, now: float) -> List[float]:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, now]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def retry_after(self, key: int, now: float) -> float:
+        # 0 = فيه توكن
+        tokens = self._bucket(key, now)[0]
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate if self.rate else float("inf")
+
+    def take(self, key: int, now: float):
+        self._bucket(key, now)[0] -= 1
+        self._calls += 1
+        if self._calls % 1024 == 0:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.capacity:
+                del self._buckets[key]
+
+
+user_limiter = RateLimiter(RATE_USER_BURST, RATE_USER_PER_MINUTE)
+guild_limiter = RateLimiter(RATE_GUILD_BURST, RATE_GUILD_PER_MINUTE)
+_recent_plays: Dict[tuple, float] = {}  # (سيرفر، الطلب الموحد) -> وقت آخر إضافة
+_rate_noticed: Dict[int, float] = {}
+_background: set = set()
+PLAY_REJECTED = Counter("bot_play_rejected_total", "play commands dropped before extraction", ("reason",))
+
+
+def throttle_play(guild_id: int, user_id: int) -> float:
+    # ترجع كم ثانية لازم ينتظر؛ 0 = مسموح وانخصم التوكن من الاثنين
+    now = time.monotonic()
+    user_wait = user_limiter.retry_after(user_id, now)
+    guild_wait = guild_limiter.retry_after(guild_id, now)
+    if user_wait or guild_wait:
+        PLAY_REJECTED.inc("user_rate" if user_wait else "guild_rate")
+        return max(user_wait, guild_wait)
+    user_limiter.take(user_id, now)
+    guild_limiter.take(guild_id, now)
+    return 0.0
+
+
+def is_duplicate_play(guild_id: int, query: str) -> bool:
+    # نفس الرابط/البحث انضاف لنفس السيرفر قبل شوي: ندمجه بدل ما نضيفه مرة ثانية
+    now = time.monotonic()
+    if len(_recent_plays) > 4096:
+        for key, at in list(_recent_plays.items()):
+            if now - at > PLAY_COALESCE_WINDOW:
+                del _recent_plays[key]
+    key = (guild_id, normalize_query(query))
+    at = _recent_plays.get(key)
+    if at is not None and now - at < PLAY_COALESCE_WINDOW:
+        PLAY_REJECTED.inc("duplicate")
+        return True
+    _recent_plays[key] = now
+    return False
+
+
+def forget_play(guild_id: int, query: str):
+    # الطلب ما انضاف (رفض/فشل)، فإعادته مو تكرار
+    _recent_plays.pop((guild_id, normalize_query(query)), None)
+
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    # الخطأ ما ينتظره أحد، فنطبعه بدل ما يضيع
+    if not task.cancelled() and task.exception() is not None:
+        print(f"⚠️ تاسك بالخلفية طاح: {task.exception()!r}")
+
+
+def spawn_background(coro: Awaitable[Any]) -> Optional[asyncio.Task]:
+    # نحتفظ بمرجع للتاسك وإلا ممكن ينمسح قبل ما يخلص
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+
+async def _send_notice(channel: discord.abc.Messageable, text: str, seconds: float):
+    try:
+        await channel.send(text, delete_after=seconds)
+    except Exception:
+        pass
+
+
+def notify(channel: discord.abc.Messageable, text: str, seconds: float = NOTICE_SECONDS):
+    # تنبيه يختفي بعد ثواني بدون ما الهاندلر ينتظره
+    if len(_background) >= NOTICE_MAX_INFLIGHT:
+        return
+    spawn_background(_send_notice(channel, text, seconds))
+
+
+def notify_rate_limited(channel: discord.abc.Messageable, user_id: int, wait: float):
+    now = time.monotonic()
+    if now - _rate_noticed.get(user_id, 0.0) < RATE_NOTICE_INTERVAL:
+        return
+    if len(_rate_noticed) > 4096:
+        _rate_noticed.clear()
+    _rate_noticed[user_id] = now
+    notify(channel, f"⏳ طلبات كثيرة، جرب بعد {wait:.0f} ثانية.")
+
+
+# --------------------------- الأحداث/الأوامر النصية ---------------------------
+class CommandRouter:
+    # كل رسالة بكل سيرفر توصل هنا؛ أغلبها سوالف، فنرفضها من أول حرف قبل أي ريجكس
+    def __init__(self):
+        self._verbs: Dict[str, tuple] = {}  # الفعل -> (الهاندلر، النص بعده: none | required | optional)
+        self._first: frozenset = frozenset()
+        self._pattern: Optional[re.Pattern] = None
+
+    def add(self, verbs: Iterable[str], handler: Callable[[discord.Message, Optional[str]], Awaitable[None]],
+            args: str = "none"):
+        for verb in verbs:
+            self._verbs[verb] = (handler, args)
+        self._first = frozenset(verb[0] for verb in self._verbs)
+        # الأطول أول عشان ما يسبقه فعل أقصر يبدأ بنفس الحروف
+        alternation = "|".join(re.escape(v) for v in sorted(self._verbs, key=len, reverse=True))
+        self._pattern = re.compile(rf"\s*({alternation})(?:\s+(.+?))?\s*$")
+
+    def match(self, content: str) -> Optional[tuple]:
+        if not content:
+            return None
+        first = content[0]
+        if first not in self._first:
+            if not first.isspace():
+                return None
+            stripped = content.lstrip()
+            if not stripped or stripped[0] not in self._first:
+                return None
+        m = self._pattern.match(content)
+        if m is None:
+            return None
+        handler, args = self._verbs[m.group(1)]
+        arg = m.group(2)
+        # "وقف" لحالها أمر، بس "وقف هنا" سوالف
+        if (args == "required" and not arg) or (args == "none" and arg):
+            return None
+        return handler, arg
+
+
+router = CommandRouter()
+
+
+async def _delete_quietly(message: discord.Message):
     try:
         await message.delete()
     except Exception:
         pass
 
-    text_channel = message.channel
-    member = message.author
-    player = get_player(message.guild)
+
+async def _same_channel_player(message: discord.Message) -> Optional[GuildPlayer]:
+    # أوامر التحكم النصية: لازم البوت شغال وصاحب الأمر معه بنفس الروم
+    player = players.get(message.guild.id)
+    if player is None or not player.vc or not player.vc.is_connected():
+        return None
+    voice = message.author.voice
+    if not voice or voice.channel != player.vc.channel:
+        notify(message.channel, "يلزم تكون مع البوت في نفس الروم الصوتي.")
+        return None
+    return player
+
+
+async def _connect_player(guild: discord.Guild, member: discord.Member,
+                          text_channel: discord.TextChannel) -> Optional[GuildPlayer]:
+    player = get_player(guild)
 
     # تأكد من الاتصال/التواجد بنفس الروم
     try:
         await player.ensure_connected(member)
     except Exception as e:
-        warn = await text_channel.send(str(e))
-        await asyncio.sleep(4)
-        try:
-            await warn.delete()
-        except Exception:
-            pass
-        return
+        notify(text_channel, str(e))
+        return None
 
     # إذا البوت متصل في روم آخر (حالة نادرة)
     if player.vc and player.vc.channel != (member.voice.channel if member.voice else None):
-        msg = await text_channel.send("يلزم تكون مع البوت في نفس الروم الصوتي.")
-        await asyncio.sleep(4)
-        try:
-            await msg.delete()
-        except Exception:
-            pass
+        notify(text_channel, "يلزم تكون مع البوت في نفس الروم الصوتي.")
+        return None
+    return player
+
+
+async def cmd_play(message: discord.Message, query: str):
+    # حذف رسالة المستخدم بالخلفية
+    spawn_background(_delete_quietly(message))
+
+    text_channel = message.channel
+    member = message.author
+
+    # قبل أي اتصال أو استخراج: المكرر يندمج، والزايد عن الحد يرفض
+    if is_duplicate_play(message.guild.id, query):
+        notify(text_channel, "🔁 هذي الأغنية انطلبت قبل شوي.")
+        return
+    wait = throttle_play(message.guild.id, member.id)
+    if wait:
+        forget_play(message.guild.id, query)
+        notify_rate_limited(text_channel, member.id, wait)
+        return
+
+    player = await _connect_player(message.guild, member, text_channel)
+    if player is None:
+        forget_play(message.guild.id, query)
+        return
+
+    if is_playlist_url(query):
+        await enqueue_playlist(player, query, member, text_channel)
         return
 
     # جيب معلومات المقطع
     try:
-        info = await fetch_yt_info(query)
+        info = await fetch_yt_info(query, message.guild.id)
     except Exception as e:
+        forget_play(message.guild.id, query)
         await text_channel.send(f"تعذر جلب المقطع: `{e}`")
         return
 
@@ -563,7 +3097,100 @@ async def on_message(message: discord.Message):
     await player.enqueue_and_maybe_play(track, text_channel)
 
 
-# تنظيف عند خروج/سحب البوت من الروم الصوتي: احذف البانل
+async def cmd_search(message: discord.Message, query: str):
+    spawn_background(_delete_quietly(message))
+    wait = throttle_play(message.guild.id, message.author.id)
+    if wait:
+        notify_rate_limited(message.channel, message.author.id, wait)
+        return
+    try:
+        results = await search_cache.search(query, message.guild.id)
+    except Exception as e:
+        notify(message.channel, f"تعذر البحث: `{e}`")
+        return
+    if not results:
+        notify(message.channel, "ما لقيت نتائج.")
+        return
+    view = SearchView(message.author, results)
+    view.message = await message.channel.send(f"🔎 نتائج: **{query[:80]}**", view=view)
+
+
+async def cmd_skip(message: discord.Message, _arg: Optional[str]):
+    spawn_background(_delete_quietly(message))
+    player = await _same_channel_player(message)
+    if player:
+        await player.skip()
+
+
+async def cmd_stop(message: discord.Message, _arg: Optional[str]):
+    spawn_background(_delete_quietly(message))
+    player = await _same_channel_player(message)
+    if player:
+        await player.stop()
+
+
+async def cmd_queue(message: discord.Message, _arg: Optional[str]):
+    player = players.get(message.guild.id)
+    if player is None or not player.queue:
+        await message.channel.send("الطابور فارغ.", delete_after=10)
+        return
+    text = "\n".join([f"{i+1}. {t.title}" for i, t in enumerate(player.queue.peek(20))])
+    await message.channel.send(f"**الطابور:**\n{text}", delete_after=30)
+
+
+async def cmd_profile(message: discord.Message, arg: Optional[str]):
+    if not await bot.is_owner(message.author):
+        return
+    if profile_session is not None:
+        await stop_profiling()
+        return
+    try:
+        seconds = float(arg) if arg else PROFILE_SECONDS
+    except ValueError:
+        return
+    session = start_profiling(seconds, f"command:{message.author.id}", message.channel)
+    await message.channel.send(f"🔬 بدأ البروفايل لمدة {session.seconds:.0f} ثانية.", delete_after=10)
+
+
+# أفعال جديدة تنضاف هنا بس
+router.add(("شغل", "تشغيل"), cmd_play, args="required")
+router.add(("ابحث",), cmd_search, args="required")
+router.add(("تخطي", "سكب"), cmd_skip)
+router.add(("ايقاف", "إيقاف", "وقف"), cmd_stop)
+router.add(("الطابور", "طابور"), cmd_queue)
+router.add(("بروفايل",), cmd_profile, args="optional")
+
+@bot.event
+async def on_ready():
+    global _reaper_task, _metrics_server, _status_task
+    print(f"✅ Logged in as {bot.user} (ID: {bot.user.id}) shards={_bot_shard_ids()}")
+    # on_ready ينادى مع كل إعادة اتصال، نبدأ المنظف مرة وحدة
+    if _reaper_task is None or _reaper_task.done():
+        _reaper_task = asyncio.create_task(reap_idle_players())
+    if SHARDED and (_status_task is None or _status_task.done()):
+        _status_task = asyncio.create_task(report_shard_status())
+    if _metrics_server is None:
+        _metrics_server = await start_metrics_server()
+    install_profile_signal()
+    if state_store:
+        state_store.start()
+        spawn_background(restore_sessions())
+
+
+@bot.event
+async def on_message(message: discord.Message):
+    # الراوتر أول: أرخص فحص ويرفض أغلب الرسايل
+    routed = router.match(message.content)
+    if routed is None:
+        return  # مش أمر
+    # تجاهل البوتات
+    if message.author.bot or not message.guild:
+        return
+    handler, arg = routed
+    await handler(message, arg)
+
+
+# تنظيف عند خروج/سحب البوت من الروم الصوتي: احذف البانل وفك المشغل
 @bot.event
 async def on_voice_state_update(member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
     if member.id != bot.user.id:
@@ -574,11 +3201,246 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
         return
     # إذا انفصل البوت كليًا
     if before.channel and after.channel is None:
-        await player.delete_panel()
+        await evict_player(guild.id)
+
+
+# --------------------------- الشاردات: الحالة واللانشر ---------------------------
+SHARD_STATUS_DIR = os.getenv("SHARD_STATUS_DIR", "shard-status")
+SHARD_STATUS_INTERVAL = float(os.getenv("SHARD_STATUS_INTERVAL", "15"))
+SHARD_IDENTIFY_DELAY = 5.0  # ديسكورد يسمح identify وحدة كل 5 ثواني
+SHARD_RESTART_BACKOFF_MAX = 60.0
+SHARD_STABLE_AFTER = 300.0  # عملية عاشت أكثر من كذا يتصفر عداد إعادة تشغيلها
+
+
+def _bot_shard_ids() -> List[int]:
+    if isinstance(bot, commands.AutoShardedBot):
+        return sorted(bot.shards) or SHARD_IDS
+    return [0]
+
+
+def _shard_latency(shard_id: int) -> Optional[float]:
+    info = bot.get_shard(shard_id) if isinstance(bot, commands.AutoShardedBot) else None
+    latency = info.latency if info is not None else bot.latency
+    # قبل أول heartbeat تكون nan/inf
+    return round(latency, 4) if 0 <= latency < float("inf") else None
+
+
+def players_by_shard() -> Dict[int, List[GuildPlayer]]:
+    out: Dict[int, List[GuildPlayer]] = {}
+    for player in players.values():
+        out.setdefault(player.guild.shard_id or 0, []).append(player)
+    return out
+
+
+def _process_load() -> Dict[str, float]:
+    # وقت الـ CPU والذاكرة بدون psutil (/proc لينكس فقط)
+    load: Dict[str, float] = {"cpu_seconds": round(time.process_time(), 3)}
+    try:
+        with open("/proc/self/statm") as f:
+            load["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return load
+
+
+def shard_status() -> Dict[str, Any]:
+    by_shard = players_by_shard()
+    guilds: Dict[int, int] = {}
+    for guild in bot.guilds:
+        guilds[guild.shard_id or 0] = guilds.get(guild.shard_id or 0, 0) + 1
+    shards = {}
+    for shard_id in _bot_shard_ids():
+        info = bot.get_shard(shard_id) if isinstance(bot, commands.AutoShardedBot) else None
+        shard_players = by_shard.get(shard_id, [])
+        shards[str(shard_id)] = {
+            "latency": _shard_latency(shard_id),
+            "closed": info.is_closed() if info is not None else bot.is_closed(),
+            "guilds": guilds.get(shard_id, 0),
+            "players": len(shard_players),
+            "playing": sum(1 for p in shard_players if p.is_playing()),
+            "queued": sum(len(p.queue) for p in shard_players),
+        }
+    return {
+        "pid": os.getpid(),
+        "shard_count": bot.shard_count or 1,
+        "updated": time.time(),
+        "shards": shards,
+        "players": player_counts(),
+        "transitions": transition_stats(),
+        "panel": panel_stats(),
+        "extract_pool": extraction_pool.stats(),
+        **_process_load(),
+    }
+
+
+def _status_path(shard_ids: List[int]) -> str:
+    name = f"shards-{shard_ids[0]}-{shard_ids[-1]}.json" if shard_ids else f"pid-{os.getpid()}.json"
+    return os.path.join(SHARD_STATUS_DIR, name)
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+async def report_shard_status():
+    # كل عملية تكتب حالة شاراتها لملف؛ اللانشر (أو أي مراقب) يقراها
+    os.makedirs(SHARD_STATUS_DIR, exist_ok=True)
+    path = _status_path(SHARD_IDS)
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, _write_json_atomic, path, shard_status())
+        except Exception as e:
+            print(f"⚠️ فشل كتابة حالة الشاردات: {e!r}")
+        await asyncio.sleep(SHARD_STATUS_INTERVAL)
+
+
+def _shard_gauge(field: str) -> Callable[[], Dict[tuple, float]]:
+    def collect() -> Dict[tuple, float]:
+        by_shard = players_by_shard()
+        out: Dict[tuple, float] = {}
+        for shard_id in _bot_shard_ids():
+            if field == "latency":
+                value = _shard_latency(shard_id)
+                if value is None:
+                    continue
+            else:
+                value = len(by_shard.get(shard_id, ()))
+            out[(str(shard_id),)] = value
+        return out
+    return collect
+
+
+CallbackGauge("bot_shard_latency_seconds", "gateway heartbeat latency", ("shard",), _shard_gauge("latency"))
+CallbackGauge("bot_shard_players", "guild players per shard", ("shard",), _shard_gauge("players"))
+
+
+def fetch_recommended_shards(token: str) -> int:
+    req = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (https://github.com/lodderx/je, 1.0)"},
+    )
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return int(json.load(resp)["shards"])
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    # شاردات متتالية لكل عملية، والزيادة على الأوائل
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _print_shard_health(ranges: List[List[int]], previous: Dict[int, tuple]):
+    now = time.time()
+    for i, shard_ids in enumerate(ranges):
+        path = _status_path(shard_ids)
+        try:
+            with open(path, encoding="utf-8") as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            print(f"   [{i}] shards {shard_ids[0]}-{shard_ids[-1]}: no status yet")
+            continue
+        shards = status["shards"].values()
+        latencies = [s["latency"] for s in shards if s["latency"] is not None]
+        # نسبة CPU من الفرق بين آخر تقريرين
+        cpu = ""
+        prev = previous.get(i)
+        if prev and prev[0] == status["pid"] and status["updated"] > prev[1]:
+            cpu = f" cpu={100 * (status['cpu_seconds'] - prev[2]) / (status['updated'] - prev[1]):.0f}%"
+        previous[i] = (status["pid"], status["updated"], status["cpu_seconds"])
+        stale = " ⚠️ stale" if now - status["updated"] > 3 * SHARD_STATUS_INTERVAL else ""
+        closed = sum(1 for s in shards if s["closed"])
+        print(
+            f"   [{i}] pid={status['pid']} shards {shard_ids[0]}-{shard_ids[-1]}"
+            f" guilds={sum(s['guilds'] for s in shards)} players={sum(s['players'] for s in shards)}"
+            f" playing={sum(s['playing'] for s in shards)}"
+            f" evicted={status.get('players', {}).get('evicted', 0)}"
+            f" latency_max={f'{max(latencies) * 1000:.0f}ms' if latencies else '-'}"
+            f" rss={status.get('rss_bytes', 0) / 2 ** 20:.0f}MB{cpu}"
+            f"{f' closed={closed}' if closed else ''}{stale}"
+        )
+
+
+def run_launcher(token: str):
+    # العملية الأم ما تتصل بديسكورد: توزع الشاردات، تعيد تشغيل اللي يطيح، وتطبع الصحة
+    shard_count = SHARD_COUNT or fetch_recommended_shards(token)
+    ranges = shard_ranges(shard_count, BOT_PROCESSES)
+    os.makedirs(SHARD_STATUS_DIR, exist_ok=True)
+    children: List[Optional[subprocess.Popen]] = [None] * len(ranges)
+    started = [0.0] * len(ranges)
+    restarts = [0] * len(ranges)
+    next_start = [0.0] * len(ranges)
+    stop = threading.Event()
+
+    def spawn(i: int):
+        env = dict(os.environ, SHARD_IDS=",".join(map(str, ranges[i])), SHARD_COUNT=str(shard_count))
+        if METRICS_PORT:
+            env["METRICS_PORT"] = str(METRICS_PORT + i)
+        if AUDIO_CACHE_DIR:
+            # كاش لكل عملية: تنظيف الـ .part والإخلاء محليين، والميزانية تنقسم عشان المجموع يبقى نفسه
+            env["AUDIO_CACHE_DIR"] = os.path.join(AUDIO_CACHE_DIR, f"p{i}")
+            env["AUDIO_CACHE_MAX_BYTES"] = str(AUDIO_CACHE_MAX_BYTES // len(ranges))
+        children[i] = subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+        started[i] = time.monotonic()
+        print(f"🚀 [{i}] pid={children[i].pid} shards {ranges[i][0]}-{ranges[i][-1]} of {shard_count}")
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    for i in range(len(ranges)):
+        spawn(i)
+        # كل عملية تخلص identify شاراتها قبل ما تبدأ اللي بعدها
+        if i + 1 < len(ranges) and stop.wait(SHARD_IDENTIFY_DELAY * len(ranges[i])):
+            break
+
+    previous: Dict[int, tuple] = {}
+    last_report = time.monotonic()
+    while not stop.wait(1.0):
+        now = time.monotonic()
+        for i, child in enumerate(children):
+            if child is None or child.poll() is None:
+                continue
+            children[i] = None
+            if now - started[i] > SHARD_STABLE_AFTER:
+                restarts[i] = 0
+            restarts[i] += 1
+            delay = min(SHARD_RESTART_BACKOFF_MAX, 2.0 ** restarts[i])
+            next_start[i] = now + delay
+            print(f"⚠️ [{i}] exited with {child.returncode}, restarting in {delay:.0f}s")
+        for i, child in enumerate(children):
+            if child is None and now >= next_start[i]:
+                spawn(i)
+        if now - last_report >= SHARD_STATUS_INTERVAL:
+            last_report = now
+            print(f"📊 {len(ranges)} processes, {shard_count} shards")
+            _print_shard_health(ranges, previous)
+
+    for child in children:
+        if child is not None and child.poll() is None:
+            child.terminate()
+    for child in children:
+        if child is None:
+            continue
+        try:
+            child.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            child.kill()
 
 
 # --------------------------- تشغيل ---------------------------
 if __name__ == "__main__":
     if not TOKEN:
         raise RuntimeError("DISCORD_TOKEN غير موجود! ضع التوكن في ملف .env")
-    bot.run("MTQ2MDAwNzIyNTQwMDc1NDI5OQ.GAs-Dg.2asN3nMhfeZ83ErRko9blx6-gJ99sNCUDIio3M")
+    if BOT_PROCESSES > 1 and not SHARD_IDS:
+        run_launcher(TOKEN)
+        sys.exit(0)
+    bot.run(TOKEN)